@@ -1,26 +1,79 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, g, jsonify, request, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta, UTC, timezone as tz
-from supabase import create_client, Client
-from supabase.lib.client_options import ClientOptions
-from typing import List, Optional, Tuple, Dict, Any, TypedDict
+from datetime import datetime, timedelta, timezone as tz
+from typing import TYPE_CHECKING, Iterable, List, Mapping, Optional, Sequence, Tuple, Dict, Any, TypedDict
 from enum import Enum
+from types import MappingProxyType
 from dataclasses import dataclass
 import io
 import csv
+import orjson
 from zoneinfo import ZoneInfo
-from postgrest import Client
-from functools import lru_cache
+from functools import cached_property
+from itertools import chain
+from collections import defaultdict
+from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 import hashlib
+import hmac
+import random
 import gc
 import psutil
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import logging
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, generate_latest, multiprocess
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Use UTC timezone
 UTC = ZoneInfo("UTC")
 
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics; each gunicorn worker keeps and serves its own counts
+CACHE_LOOKUPS = Counter(
+    'tokenoptimizer_cache_lookups_total',
+    'In-process cache lookups by cache and outcome',
+    ['cache', 'result']
+)
+SUPABASE_RETRIES = Counter(
+    'tokenoptimizer_supabase_retries_total',
+    'Supabase requests retried after a transient failure',
+    ['reason']
+)
+RPC_FALLBACKS = Counter(
+    'tokenoptimizer_rpc_fallbacks_total',
+    'RPC calls that failed and fell back to reading raw rows',
+    ['function']
+)
+FALLBACK_PAGES = Counter(
+    'tokenoptimizer_fallback_pages_total',
+    'Raw-row pages fetched by fallback aggregations'
+)
+
+# Gateway responses worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+
+# Columns the logs endpoint can be sorted by
+VALID_SORT_FIELDS = frozenset({'timestamp', 'total_cost', 'total_tokens', 'latency_ms'})
+
+# Columns the logs endpoint returns
+LOG_COLUMNS = (
+    'id, timestamp, model, endpoint_name, api_provider, prompt_tokens, completion_tokens, '
+    'total_tokens, input_cost, output_cost, total_cost, latency_ms'
+)
+
 class TimeGranularity(Enum):
     HOUR = "hour"
     DAY = "day"
@@ -28,22 +81,243 @@ class TimeGranularity(Enum):
     MONTH = "month"
     YEAR = "year"
 
+# SQL timestamp format for grouping based on granularity
+GRANULARITY_SQL_FORMATS = MappingProxyType({
+    TimeGranularity.YEAR: "YYYY-MM",  # Group by month within year
+    TimeGranularity.MONTH: "YYYY-WW",  # Group by week within month
+    TimeGranularity.WEEK: "YYYY-MM-DD",  # Group by day within week
+    TimeGranularity.DAY: "HH24",  # Group by hour within day
+    TimeGranularity.HOUR: "HH24:MI"  # Group by minute within hour
+})
+
+# Start of the bucket containing a moment, per granularity
+BUCKET_START = MappingProxyType({
+    TimeGranularity.HOUR: lambda t: t.replace(minute=0, second=0, microsecond=0),
+    TimeGranularity.DAY: lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0),
+    TimeGranularity.WEEK: lambda t: (t - timedelta(days=t.weekday())).replace(hour=0, minute=0, second=0, microsecond=0),
+    TimeGranularity.MONTH: lambda t: t.replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+    TimeGranularity.YEAR: lambda t: t.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+})
+
+# Start of the following bucket, given the start of a bucket
+NEXT_BUCKET = MappingProxyType({
+    TimeGranularity.HOUR: lambda t: t + timedelta(hours=1),
+    TimeGranularity.DAY: lambda t: t + timedelta(days=1),
+    TimeGranularity.WEEK: lambda t: t + timedelta(weeks=1),
+    TimeGranularity.MONTH: lambda t: t.replace(year=t.year + t.month // 12, month=t.month % 12 + 1),
+    TimeGranularity.YEAR: lambda t: t.replace(year=t.year + 1)
+})
+
+# strftime format for trend period labels
+PERIOD_LABEL_FORMATS = MappingProxyType({
+    TimeGranularity.HOUR: '%I %p',
+    TimeGranularity.DAY: '%b %d',
+    TimeGranularity.WEEK: 'Week of %b %d',
+    TimeGranularity.MONTH: '%b %Y',
+    TimeGranularity.YEAR: '%Y'
+})
+
+# Model characteristics for recommendations
+MODEL_CHARACTERISTICS = MappingProxyType({
+    'gpt-4': MappingProxyType({
+        'capabilities': ('complex_reasoning', 'code_generation', 'creative_writing'),
+        'cost_per_1k': 0.03,
+        'alternatives': ('gpt-3.5-turbo-16k', 'gpt-3.5-turbo')
+    }),
+    'gpt-4-32k': MappingProxyType({
+        'capabilities': ('complex_reasoning', 'code_generation', 'creative_writing', 'long_context'),
+        'cost_per_1k': 0.06,
+        'alternatives': ('gpt-4', 'gpt-3.5-turbo-16k')
+    }),
+    'gpt-3.5-turbo': MappingProxyType({
+        'capabilities': ('general_purpose', 'chat', 'basic_tasks'),
+        'cost_per_1k': 0.002,
+        'alternatives': ()
+    }),
+    'gpt-3.5-turbo-16k': MappingProxyType({
+        'capabilities': ('general_purpose', 'chat', 'basic_tasks', 'medium_context'),
+        'cost_per_1k': 0.003,
+        'alternatives': ('gpt-3.5-turbo',)
+    }),
+    'claude-2': MappingProxyType({
+        'capabilities': ('complex_reasoning', 'code_generation', 'creative_writing', 'long_context'),
+        'cost_per_1k': 0.08,
+        'alternatives': ('claude-instant-1', 'gpt-4')
+    }),
+    'claude-instant-1': MappingProxyType({
+        'capabilities': ('general_purpose', 'chat', 'basic_tasks'),
+        'cost_per_1k': 0.0015,
+        'alternatives': ('gpt-3.5-turbo',)
+    })
+})
+
 @dataclass
 class FilterParams:
     """Data class for standardizing filter parameters across all endpoints"""
     time_granularity: TimeGranularity
     start_date: datetime
     end_date: datetime
-    models: List[str]
-    endpoints: List[str]
-    providers: List[str]
+    models: Tuple[str, ...]
+    endpoints: Tuple[str, ...]
+    providers: Tuple[str, ...]
+
+    # Derived values computed once per request and reused by cache keys and queries
+    @cached_property
+    def start_iso(self) -> str:
+        return self.start_date.isoformat()
+
+    @cached_property
+    def end_iso(self) -> str:
+        return self.end_date.isoformat()
+
+    @cached_property
+    def models_sorted(self) -> Tuple[str, ...]:
+        return tuple(sorted(self.models))
+
+    @cached_property
+    def endpoints_sorted(self) -> Tuple[str, ...]:
+        return tuple(sorted(self.endpoints))
+
+    @cached_property
+    def providers_sorted(self) -> Tuple[str, ...]:
+        return tuple(sorted(self.providers))
+
+def configure_logging() -> None:
+    """Route app logs through a queue so request threads never block on stderr writes"""
+    if any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
+
+def to_columns(rows: List[Dict[str, Any]], keys: List[str]) -> Dict[str, np.ndarray]:
+    """Convert PostgREST rows (a list of dicts) into one NumPy array per column"""
+    return {key: np.array([row[key] for row in rows], dtype=object) for key in keys}
+
+def factorize_labels(labels: np.ndarray) -> Tuple[np.ndarray, List[Any]]:
+    """Integer group codes for a label column plus the distinct labels, keeping NULL (None) as its own group"""
+    codes, uniques = pd.factorize(labels, use_na_sentinel=False)
+    return codes, [None if pd.isna(label) else label for label in uniques.tolist()]
+
+# Numeric token_logs columns read by the raw-row fallbacks, with the dtype each is parsed as
+METRIC_COLUMNS = MappingProxyType({'total_cost': np.float64, 'total_tokens': np.int64})
+
+USAGE_METRIC_COLUMNS = MappingProxyType({
+    **METRIC_COLUMNS,
+    'prompt_tokens': np.int64,
+    'completion_tokens': np.int64,
+    'input_cost': np.float64,
+    'output_cost': np.float64
+})
+
+def csv_metrics_frame(
+    text: str,
+    label_keys: List[str],
+    numeric_columns: Mapping[str, Any] = METRIC_COLUMNS,
+    nullable_columns: Sequence[str] = ()
+) -> pd.DataFrame:
+    """Parse a PostgREST CSV body into label columns plus typed numeric columns.
+
+    NULL labels become None and NULL numerics become 0, except in nullable_columns,
+    which are read as float64 with NULL kept as NaN.
+    """
+    columns = [*label_keys, *numeric_columns, *nullable_columns]
+    if not text.strip():
+        return pd.DataFrame(columns=columns)
+    df = pd.read_csv(
+        io.StringIO(text),
+        usecols=columns,
+        # Only PostgREST's empty NULL field is missing; labels like 'NA' or 'null' are kept as text
+        keep_default_na=False,
+        na_values=[''],
+        dtype={**{key: object for key in label_keys}, **{column: np.float64 for column in nullable_columns}}
+    )
+    df[label_keys] = df[label_keys].where(df[label_keys].notna(), None)
+    for column, dtype in numeric_columns.items():
+        df[column] = df[column].fillna(0).astype(dtype)
+    return df
+
+def trend_bucket_keys(timestamps: pd.Series, granularity: TimeGranularity) -> pd.Series:
+    """Vectorized trend bucket keys ('YYYY-MM-DD HH:00:00') sliced from ISO-8601 timestamp strings"""
+    if granularity == TimeGranularity.HOUR:
+        return timestamps.str[:10] + ' ' + timestamps.str[11:13] + ':00:00'
+    if granularity == TimeGranularity.DAY:
+        return timestamps.str[:10] + ' 00:00:00'
+    if granularity == TimeGranularity.WEEK:
+        days = timestamps.str[:10].to_numpy().astype('datetime64[D]')
+        # Day 0 (1970-01-01) was a Thursday, so (day + 3) % 7 is the Monday-based weekday
+        week_starts = days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+        return pd.Series(np.datetime_as_string(week_starts, unit='D'), index=timestamps.index) + ' 00:00:00'
+    if granularity == TimeGranularity.MONTH:
+        return timestamps.str[:7] + '-01 00:00:00'
+    return timestamps.str[:4] + '-01-01 00:00:00'
+
+def clean_names(names: Iterable[str]) -> Tuple[str, ...]:
+    """Strip names and drop blanks and duplicates, preserving order, in a single pass"""
+    return tuple(dict.fromkeys(stripped for stripped in (name.strip() for name in names if name) if stripped))
+
+def sorted_unique(values: pd.Series) -> List[Any]:
+    """Distinct values of a group as a sorted list"""
+    return sorted(values.unique().tolist())
+
+# Process handle and last memory sample, so hot paths don't hit /proc on every request
+_proc = psutil.Process(os.getpid())
+_mem_cache = {'t': 0.0, 'v': 0.0}
+
+def current_process() -> psutil.Process:
+    """Return the psutil handle for this process, rebuilt after a fork so workers never report the parent"""
+    global _proc
+    if _proc.pid != os.getpid():
+        _proc = psutil.Process(os.getpid())
+        _mem_cache['t'] = 0.0
+    return _proc
+
+def mem_pct() -> float:
+    """Return this process's memory usage percent, sampled at most once per second"""
+    proc = current_process()
+    now = time.monotonic()
+    if now - _mem_cache['t'] > 1.0:
+        _mem_cache.update(t=now, v=proc.memory_percent())
+    return _mem_cache['v']
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes responses with orjson"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
 
 class TokenOptimizerApp(Flask):
+    json_provider_class = OrjsonProvider
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.supabase: Client = None
+        self.supabase: 'Client' = None
 
 def create_app():
+    # supabase-py pulls in httpx, postgrest, gotrue, storage3 and realtime, so only
+    # pay for them when an app is actually built
+    import httpx
+    from supabase import create_client
+    from supabase.lib.client_options import ClientOptions
+    from postgrest.exceptions import APIError
+
+    configure_logging()
+
     # Initialize Flask app
     app = TokenOptimizerApp(__name__)
     
@@ -63,15 +337,15 @@ def create_app():
 
     # Load environment variables from root directory
     env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-    print(f"Loading .env from: {env_path}")
+    logger.debug("Loading .env from: %s", env_path)
     load_dotenv(env_path)
 
     # Initialize Supabase client
     supabase_url = "https://qregilyvkbwzvudfgxst.supabase.co"
     supabase_key = os.getenv("SUPABASE_ANON_KEY")
 
-    print(f"SUPABASE_URL: {supabase_url}")
-    print(f"SUPABASE_KEY length: {len(supabase_key) if supabase_key else 0}")
+    logger.debug("SUPABASE_URL: %s", supabase_url)
+    logger.debug("SUPABASE_KEY length: %d", len(supabase_key) if supabase_key else 0)
 
     if not supabase_url or not supabase_key:
         raise ValueError("Missing Supabase credentials. Please check your .env file.")
@@ -86,50 +360,192 @@ def create_app():
                 persist_session=False         # Disable session persistence
             )
         )
+        # Replace PostgREST's default HTTP session with one sized for keep-alive reuse
+        # across the worker's threads and the I/O pool; HTTP/2 lets concurrent page
+        # fetches share a connection instead of each opening its own
+        pool_limits = httpx.Limits(
+            max_connections=int(os.getenv('SUPABASE_POOL_SIZE', '50')),
+            max_keepalive_connections=int(os.getenv('SUPABASE_POOL_KEEPALIVE', '20')),
+            keepalive_expiry=30.0
+        )
+        def decode_json_with_orjson(response):
+            # postgrest-py parses every execute() body via response.json(); swap in orjson
+            response.json = lambda **kwargs: orjson.loads(response.read())
+
+        default_session = app.supabase.postgrest.session
+        app.supabase.postgrest.session = type(default_session)(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=default_session.timeout,
+            limits=pool_limits,
+            http2=True,
+            event_hooks={'response': [decode_json_with_orjson]}
+        )
+        default_session.close()
+        logger.info(
+            "Supabase HTTP pool: max_connections=%s, max_keepalive_connections=%s",
+            pool_limits.max_connections,
+            pool_limits.max_keepalive_connections
+        )
+        atexit.register(app.supabase.postgrest.session.close)
     except Exception as e:
-        print(f"Error initializing Supabase client: {str(e)}")
+        logger.exception("Error initializing Supabase client")
         raise e
 
-    # Add garbage collection for memory management
-    gc.enable()
-    gc.collect()
-
-    # Add request cleanup
+    # Shed cached results under memory pressure; the interpreter's own GC handles the rest
     @app.after_request
     def cleanup_after_request(response):
         cleanup_cache()
-        gc.collect()
         return response
 
+    # Shared pool so independent Supabase round-trips can overlap instead of queueing
+    io_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv('SUPABASE_IO_WORKERS', '8')),
+        thread_name_prefix='supabase-io'
+    )
+    atexit.register(io_executor.shutdown, wait=False)
+
+    def run_concurrently(*calls):
+        """Run independent blocking calls on the I/O pool and return their results in order"""
+        futures = [io_executor.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+    def with_retries(call, attempts: int = 3, base_delay: float = 0.05):
+        """Run `call`, retrying transport errors and retryable statuses with jittered exponential backoff"""
+        for attempt in range(attempts):
+            try:
+                return call()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == attempts - 1:
+                    raise
+                reason = str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+                SUPABASE_RETRIES.labels(reason).inc()
+                logger.warning("Retrying Supabase request after %s", e)
+                time.sleep(base_delay * 2 ** attempt + random.uniform(0, base_delay))
+
     # Add memory-efficient query helper
     def execute_query_with_limit(query, limit=50):
         """Execute query with pagination to prevent memory issues"""
         try:
             return query.limit(limit).execute()
-        except Exception as e:
-            print(f"Query error: {str(e)}")
+        except Exception:
+            logger.exception("Query error")
+            return None
+
+    def send_request(query, headers, params):
+        """Send a built PostgREST request on the raw session, retrying transport errors and retryable statuses"""
+        def send():
+            response = query.session.request(query.http_method, query.path, json=query.json, params=params, headers=headers)
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+            return response
+
+        return with_retries(send)
+
+    def request_rows(query, accept: str, row_range: Optional[Tuple[int, int]] = None) -> str:
+        """Send a built PostgREST select, optionally for an inclusive row range, without mutating the builder"""
+        headers = query.headers.copy()
+        headers['Accept'] = accept
+        params = query.params
+        if row_range is not None:
+            headers['Range-Unit'] = 'items'
+            headers['Range'] = '%d-%d' % row_range
+            # Offsets are only stable over a total order; page by primary key unless already ordered
+            if 'order' not in params:
+                params = params.add('order', 'id')
+
+        response = send_request(query, headers, params)
+        if row_range is not None and response.status_code == 416:
+            return ''  # Offset past the last row
+        response.raise_for_status()
+        return response.text
+
+    def fetch_metrics_frame(query, label_keys: List[str], row_range: Optional[Tuple[int, int]] = None, **columns) -> pd.DataFrame:
+        """Execute a PostgREST select as CSV so rows arrive as columns rather than one JSON dict each"""
+        return csv_metrics_frame(request_rows(query, 'text/csv', row_range), label_keys, **columns)
+
+    page_concurrency = int(os.getenv('SUPABASE_PAGE_CONCURRENCY', '4'))
+    # Pages must not exceed PostgREST's max-rows (1000 on Supabase by default), or each
+    # range is silently cut short and the rows past the cap are skipped
+    max_rows = int(os.getenv('SUPABASE_MAX_ROWS', '1000'))
+
+    def fetch_pages(fetch_page, page_size: int = max_rows):
+        """Yield non-empty pages in order, fetching page_concurrency row ranges at a time on the I/O pool"""
+        start = 0
+        while True:
+            futures = [
+                io_executor.submit(fetch_page, (offset, offset + page_size - 1))
+                for offset in range(start, start + page_size * page_concurrency, page_size)
+            ]
+            try:
+                for future in futures:
+                    page = future.result()
+                    if not len(page):
+                        return
+                    FALLBACK_PAGES.inc()
+                    yield page
+            finally:
+                for future in futures:
+                    future.cancel()
+            start += page_size * page_concurrency
+
+    def fetch_all_metrics(query, label_keys: List[str], **columns) -> pd.DataFrame:
+        """Fetch every row of a select as one frame, paging so the max-rows cap can't truncate it"""
+        pages = list(fetch_pages(lambda row_range: fetch_metrics_frame(query, label_keys, row_range, **columns)))
+        return pd.concat(pages, ignore_index=True) if pages else csv_metrics_frame('', label_keys, **columns)
+
+    # A function that isn't deployed (PostgREST 404 / PGRST202) is skipped for RPC_RETRY_AFTER
+    # seconds so callers go straight to their fallback. Any other error is raised rather than
+    # answered with a raw-row scan against the database that just failed, and after
+    # RPC_FAIL_MAX consecutive errors calls fail fast for RPC_RETRY_AFTER seconds.
+    rpc_retry_after = float(os.getenv('RPC_RETRY_AFTER', '30'))
+    rpc_fail_max = int(os.getenv('RPC_FAIL_MAX', '5'))
+    rpc_missing_until: Dict[str, float] = {}
+    rpc_open_until: Dict[str, float] = {}
+    rpc_failures: Dict[str, int] = {}
+
+    def call_rpc(function_name: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Call a Postgres function, returning None if it isn't deployed so callers can fall back"""
+        now = time.monotonic()
+        if now < rpc_missing_until.get(function_name, 0):
+            RPC_FALLBACKS.labels(function_name).inc()
             return None
+        if now < rpc_open_until.get(function_name, 0):
+            raise RuntimeError(f"RPC {function_name} failing, retrying after cool-down")
+        try:
+            # Sent on the raw session rather than via execute(), which turns every non-2xx into an
+            # APIError without the status code, so 429/5xx responses can be retried like row reads
+            query = app.supabase.rpc(function_name, params)
+            response = send_request(query, query.headers, query.params)
+            if response.status_code == 404:
+                rpc_missing_until[function_name] = time.monotonic() + rpc_retry_after
+                RPC_FALLBACKS.labels(function_name).inc()
+                logger.warning("RPC %s not deployed, using fallback for %ss: %s", function_name, rpc_retry_after, response.text)
+                return None
+            response.raise_for_status()
+            rows = response.json() or []
+        except Exception:
+            failures = rpc_failures[function_name] = rpc_failures.get(function_name, 0) + 1
+            if failures >= rpc_fail_max:
+                rpc_open_until[function_name] = time.monotonic() + rpc_retry_after
+                rpc_failures[function_name] = 0
+                logger.warning("RPC %s failed %d times in a row, failing fast for %ss", function_name, failures, rpc_retry_after)
+            raise
+        rpc_failures.pop(function_name, None)
+        return rows
 
     # Add memory cleanup for cache
     def cleanup_cache():
         """Cleanup LRU cache when memory usage is high"""
-        process = psutil.Process(os.getpid())
-        memory_percent = process.memory_percent()
+        memory_percent = mem_pct()
         
         # More aggressive cache cleanup
         if memory_percent > 70:  # Lower threshold for proactive cleanup
-            get_cached_metrics_summary.cache_clear()
-            get_cached_metrics_trend.cache_clear()
-            get_cached_recommendations.cache_clear()
-            gc.collect()
+            with result_cache_lock:
+                result_cache.clear()
         
         # Emergency cleanup
         if memory_percent > 85:
-            get_cached_metrics_summary.cache_clear()
-            get_cached_metrics_trend.cache_clear()
-            get_cached_recommendations.cache_clear()
-            gc.collect()
-            
             # Clear all module-level caches
             for cache_name, cache_func in list(globals().items()):
                 if hasattr(cache_func, 'cache_clear'):
@@ -139,54 +555,16 @@ def create_app():
             gc.collect(generation=2)
 
     # Modify existing query functions to use pagination
-    def query_token_logs(filters: FilterParams) -> Tuple[List, int]:
-        """Query token logs with filters and memory optimization"""
-        try:
-            # Start with base query and select only needed columns
-            query = app.supabase.table('token_logs').select(
-                "timestamp, model, endpoint_name, api_provider, prompt_tokens, completion_tokens, total_tokens, latency_ms, input_cost, output_cost",
-                count="exact"
-            )
-
-            # Apply date filters with timezone handling
-            query = query.gte('timestamp', filters.start_date.astimezone(UTC).isoformat())
-            query = query.lt('timestamp', filters.end_date.astimezone(UTC).isoformat())
-
-            # Apply filters
-            if filters.models:
-                query = query.in_('model', filters.models)
-            if filters.endpoints:
-                query = query.in_('endpoint_name', filters.endpoints)
-            if filters.providers:
-                query = query.in_('api_provider', filters.providers)
-
-            # Initialize result containers
-            all_data = []
-            total_count = 0
-            page_size = 1000  # Process 1000 records at a time
-            
-            # Paginate through results
-            for start in range(0, 10000, page_size):  # Cap at 10000 records for safety
-                response = query.range(start, start + page_size - 1).execute()
-                
-                if not response.data:
-                    break
-                    
-                all_data.extend(response.data)
-                total_count = response.count
-                
-                # Force garbage collection after each page
-                gc.collect()
-                
-                # Break if we've got all records
-                if len(all_data) >= total_count:
-                    break
-
-            return all_data, total_count
-
-        except Exception as e:
-            print(f"Error querying token logs: {str(e)}")
-            return [], 0
+    def query_agg(filters: FilterParams, function_name: str, **params) -> Optional[List[Dict[str, Any]]]:
+        """Run a filtered aggregate function in Postgres, returning None if it isn't deployed"""
+        return call_rpc(function_name, {
+            'start_date': filters.start_iso,
+            'end_date': filters.end_iso,
+            'models': filters.models or None,
+            'endpoints': filters.endpoints or None,
+            'providers': filters.providers or None,
+            **params
+        })
 
     # Type definitions
     class ModelMetrics(TypedDict):
@@ -208,41 +586,34 @@ def create_app():
         usage_count: int
         reason: Optional[str]
 
-    # Model characteristics for recommendations
-    MODEL_CHARACTERISTICS = {
-        'gpt-4': {
-            'capabilities': ['complex_reasoning', 'code_generation', 'creative_writing'],
-            'cost_per_1k': 0.03,
-            'alternatives': ['gpt-3.5-turbo-16k', 'gpt-3.5-turbo']
-        },
-        'gpt-4-32k': {
-            'capabilities': ['complex_reasoning', 'code_generation', 'creative_writing', 'long_context'],
-            'cost_per_1k': 0.06,
-            'alternatives': ['gpt-4', 'gpt-3.5-turbo-16k']
-        },
-        'gpt-3.5-turbo': {
-            'capabilities': ['general_purpose', 'chat', 'basic_tasks'],
-            'cost_per_1k': 0.002,
-            'alternatives': []
-        },
-        'gpt-3.5-turbo-16k': {
-            'capabilities': ['general_purpose', 'chat', 'basic_tasks', 'medium_context'],
-            'cost_per_1k': 0.003,
-            'alternatives': ['gpt-3.5-turbo']
-        },
-        'claude-2': {
-            'capabilities': ['complex_reasoning', 'code_generation', 'creative_writing', 'long_context'],
-            'cost_per_1k': 0.08,
-            'alternatives': ['claude-instant-1', 'gpt-4']
-        },
-        'claude-instant-1': {
-            'capabilities': ['general_purpose', 'chat', 'basic_tasks'],
-            'cost_per_1k': 0.0015,
-            'alternatives': ['gpt-3.5-turbo']
-        }
-    }
+    def fetch_timestamp_bound(descending: bool) -> Optional[str]:
+        """Return the newest (or oldest) token_logs timestamp, or None if the table is empty"""
+        response = app.supabase.table('token_logs').select(
+            'timestamp'
+        ).order('timestamp', desc=descending).limit(1).execute()
+        return response.data[0]['timestamp'] if response.data else None
+
+    @cached(TTLCache(maxsize=1, ttl=60), lock=threading.Lock())
+    def get_data_bounds() -> Tuple[Optional[str], Optional[str]]:
+        """Return the (min, max) token_logs timestamps; the bounds barely move, so keep them for a minute"""
+        rows = call_rpc('date_range', {})
+        if rows is not None:
+            return (rows[0]['min_timestamp'], rows[0]['max_timestamp']) if rows else (None, None)
+
+        # Function not deployed yet: issue both probes at once instead of back to back
+        max_timestamp, min_timestamp = run_concurrently(
+            lambda: fetch_timestamp_bound(True),
+            lambda: fetch_timestamp_bound(False)
+        )
+        return min_timestamp, max_timestamp
 
     def parse_filters() -> FilterParams:
+        """Parse and validate filter parameters from request, once per request"""
+        if 'filters' not in g:
+            g.filters = parse_request_filters()
+        return g.filters
+
+    def parse_request_filters() -> FilterParams:
         """Parse and validate filter parameters from request"""
         try:
             # If dates are provided in the request, use those
@@ -256,77 +627,54 @@ def create_app():
             except ValueError:
                 time_granularity = TimeGranularity.MONTH
             
-            # If dates are not provided, determine them from the data
-            if not (start_date and end_date):
-                # Query the min and max timestamps
-                response = app.supabase.table('token_logs').select(
-                    'timestamp'
-                ).order('timestamp', desc=True).limit(1).execute()
-                
-                if response.data:
-                    max_date = datetime.fromisoformat(response.data[0]['timestamp'].replace('Z', '+00:00'))
-                else:
-                    max_date = datetime.now(UTC)
-                    
-                response = app.supabase.table('token_logs').select(
-                    'timestamp'
-                ).order('timestamp', desc=False).limit(1).execute()
-                
-                if response.data:
-                    min_date = datetime.fromisoformat(response.data[0]['timestamp'].replace('Z', '+00:00'))
-                else:
-                    min_date = max_date - timedelta(days=365)
-                
-                # Use the actual data range if no dates provided
-                if not end_date:
-                    end_date = max_date.isoformat()
-                if not start_date:
-                    start_date = min_date.isoformat()
-                
-                print(f"Using date range from data: {start_date} to {end_date}")
-            
             # Clean and validate models (handle both 'model' and 'models')
-            models = [
-                model.strip()
-                for model in (request.args.getlist('model') + request.args.getlist('models'))
-                if model and model.strip()
-            ]
+            models = clean_names(chain(request.args.getlist('model'), request.args.getlist('models')))
             
             # Clean and validate endpoints (handle both 'endpoint' and 'endpoints')
-            endpoints = [
-                endpoint.strip()
-                for endpoint in (request.args.getlist('endpoint') + request.args.getlist('endpoints'))
-                if endpoint and endpoint.strip()
-            ]
+            endpoints = clean_names(chain(request.args.getlist('endpoint'), request.args.getlist('endpoints')))
             
             # Clean and validate providers (handle both 'provider' and 'providers')
-            providers = [
-                provider.strip()
-                for provider in (request.args.getlist('provider') + request.args.getlist('providers'))
-                if provider and provider.strip()
-            ]
+            providers = clean_names(chain(request.args.getlist('provider'), request.args.getlist('providers')))
             
             # Parse and validate dates
             try:
-                start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
+                start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00')) if start_date else None
+                end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00')) if end_date else None
+                
+                # If dates are not provided, determine them from the data
+                if start_date is None or end_date is None:
+                    # Look up the min and max timestamps
+                    min_timestamp, max_timestamp = get_data_bounds()
+                    
+                    if max_timestamp:
+                        max_date = datetime.fromisoformat(max_timestamp.replace('Z', '+00:00'))
+                    else:
+                        max_date = datetime.now(UTC)
+                    
+                    # Use the actual data range if no dates provided
+                    if end_date is None:
+                        end_date = max_date
+                    if start_date is None:
+                        if min_timestamp:
+                            start_date = datetime.fromisoformat(min_timestamp.replace('Z', '+00:00'))
+                        else:
+                            start_date = max_date - timedelta(days=365)
+                    
+                    logger.debug("Using date range from data: %s to %s", start_date, end_date)
                 
                 # Ensure start_date is before end_date
                 if start_date > end_date:
                     start_date, end_date = end_date, start_date
                     
-                # Ensure dates are in UTC
-                start_date = start_date.astimezone(UTC)
-                end_date = end_date.astimezone(UTC)
+                # Ensure dates are in UTC, skipping the conversion for values that already are
+                if start_date.utcoffset() != timedelta(0):
+                    start_date = start_date.astimezone(UTC)
+                if end_date.utcoffset() != timedelta(0):
+                    end_date = end_date.astimezone(UTC)
                 
             except ValueError as e:
                 raise ValueError(f"Invalid date format: {str(e)}")
             
-            # Remove duplicates while preserving order
-            models = list(dict.fromkeys(models))
-            endpoints = list(dict.fromkeys(endpoints))
-            providers = list(dict.fromkeys(providers))
-            
             return FilterParams(
                 time_granularity=time_granularity,
                 start_date=start_date,
@@ -336,44 +684,21 @@ def create_app():
                 providers=providers
             )
         except Exception as e:
-            print(f"Error parsing filters: {str(e)}")
-            print(f"Request args: {dict(request.args)}")
+            logger.exception("Error parsing filters (request args: %s)", request.args)
             raise ValueError(f"Failed to parse filters: {str(e)}")
 
     def get_time_group_format(granularity: TimeGranularity) -> str:
         """Get SQL timestamp format for grouping based on granularity"""
-        formats = {
-            TimeGranularity.YEAR: "YYYY-MM",  # Group by month within year
-            TimeGranularity.MONTH: "YYYY-WW",  # Group by week within month
-            TimeGranularity.WEEK: "YYYY-MM-DD",  # Group by day within week
-            TimeGranularity.DAY: "HH24",  # Group by hour within day
-            TimeGranularity.HOUR: "HH24:MI"  # Group by minute within hour
-        }
-        return formats[granularity]
+        return GRANULARITY_SQL_FORMATS[granularity]
 
     def query_monthly_metrics() -> List[Dict[str, Any]]:
         """Query monthly aggregated metrics directly from the database"""
         try:
-            print("Executing monthly metrics query...")
+            logger.debug("Executing monthly metrics query...")
             current_year = datetime.now(UTC).year
             start_date = f"{current_year}-01-01"
             end_date = f"{current_year}-12-31"
             
-            # Query all data for the current year
-            response = app.supabase.table('token_logs').select(
-                'timestamp',
-                'total_cost',
-                'total_tokens',
-                'model',
-                'endpoint_name',
-                'api_provider'
-            ).gte('timestamp', start_date).lte('timestamp', end_date).execute()
-            
-            print(f"Raw response count: {len(response.data) if response.data else 0}")
-            
-            if not response.data:
-                return []
-            
             # Initialize all months for the current year
             monthly_data = {}
             for month in range(1, 13):
@@ -391,18 +716,60 @@ def create_app():
                     'providers_used': set()
                 }
             
-            # Process the data
-            for row in response.data:
-                timestamp = datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00'))
-                month_key = timestamp.strftime('%Y-%m')
+            # Aggregate by month in the database when the function is deployed
+            month_rows = call_rpc('metrics_by_month', {'start_date': start_date, 'end_date': end_date})
+            if month_rows is not None:
+                if not month_rows:
+                    return []
+                
+                for row in month_rows:
+                    if row['period'] in monthly_data:
+                        monthly_data[row['period']].update(
+                            total_spend=row['total_spend'],
+                            total_requests=row['total_requests'],
+                            total_tokens=row['total_tokens'],
+                            models_used=set(row['models_used']),
+                            endpoints_used=set(row['endpoints_used']),
+                            providers_used=set(row['providers_used'])
+                        )
+            else:
+                # Query all data for the current year
+                df = fetch_all_metrics(app.supabase.table('token_logs').select(
+                    'timestamp',
+                    'total_cost',
+                    'total_tokens',
+                    'model',
+                    'endpoint_name',
+                    'api_provider'
+                ).gte('timestamp', start_date).lte('timestamp', end_date), ['timestamp', 'model', 'endpoint_name', 'api_provider'])
                 
-                if month_key in monthly_data:
-                    monthly_data[month_key]['total_spend'] += float(row['total_cost'])
-                    monthly_data[month_key]['total_requests'] += 1
-                    monthly_data[month_key]['total_tokens'] += int(row['total_tokens'])
-                    monthly_data[month_key]['models_used'].add(row['model'])
-                    monthly_data[month_key]['endpoints_used'].add(row['endpoint_name'])
-                    monthly_data[month_key]['providers_used'].add(row['api_provider'])
+                logger.debug("Raw response count: %d", len(df))
+                
+                if df.empty:
+                    return []
+                
+                # Group the columns by month in one vectorized pass
+                # ISO-8601 timestamps start with YYYY-MM, so slice rather than parse
+                df['month'] = df['timestamp'].str[:7]
+                grouped = df.groupby('month').agg(
+                    total_spend=('total_cost', 'sum'),
+                    total_requests=('total_cost', 'size'),
+                    total_tokens=('total_tokens', 'sum'),
+                    models_used=('model', 'unique'),
+                    endpoints_used=('endpoint_name', 'unique'),
+                    providers_used=('api_provider', 'unique')
+                )
+                
+                for month_key, row in grouped.iterrows():
+                    if month_key in monthly_data:
+                        monthly_data[month_key].update(
+                            total_spend=float(row['total_spend']),
+                            total_requests=int(row['total_requests']),
+                            total_tokens=int(row['total_tokens']),
+                            models_used=set(row['models_used']),
+                            endpoints_used=set(row['endpoints_used']),
+                            providers_used=set(row['providers_used'])
+                        )
             
             # Convert sets to lists and prepare final result
             result = []
@@ -416,48 +783,142 @@ def create_app():
             result.sort(key=lambda x: x['period'])
             return result
             
-        except Exception as e:
-            print(f"Error querying monthly metrics: {str(e)}")
-            print(f"Full error details: {repr(e)}")
+        except Exception:
+            logger.exception("Error querying monthly metrics")
             return []
 
     # Cache key generator
-    def make_cache_key(*args, **kwargs):
-        # Convert args and kwargs to strings and sort for consistency
-        key_parts = [str(arg) for arg in args]
-        key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
-        # Create a hash of the key parts
-        return hashlib.md5("".join(key_parts).encode()).hexdigest()
-
-    # Cache decorators with TTL and increased cache size
-    @lru_cache(maxsize=32)
-    def get_cached_metrics_summary(cache_key: str, ttl_hash: str):
+    def make_cache_key(kind: str, filters: FilterParams, *extra: str) -> str:
+        """Digest `kind` and the filter values into a fixed-size key, feeding BLAKE2b without building key tuples"""
+        digest = hashlib.blake2b(kind.encode(), digest_size=16)
+        for value in (filters.start_iso, filters.end_iso, *extra):
+            digest.update(b'\x00')
+            digest.update(value.encode())
+        # Tag each name with its dimension so e.g. a model and an endpoint of the same name differ
+        for tag, names in (
+            (b'\x00m', filters.models_sorted),
+            (b'\x00e', filters.endpoints_sorted),
+            (b'\x00p', filters.providers_sorted)
+        ):
+            for name in names:
+                digest.update(tag)
+                digest.update(name.encode())
+        return digest.hexdigest()
+
+    def request_cache_key(kind: str) -> str:
+        """Build the `kind` cache key from the current request's filters"""
+        filters = parse_filters()
+        # Only the trend is shaped by granularity
+        if kind == 'trend':
+            return make_cache_key(kind, filters, filters.time_granularity.value)
+        return make_cache_key(kind, filters)
+
+    # Shared TTL cache for computed results, keyed on (kind, cache_key)
+    result_cache = TTLCache(maxsize=256, ttl=120)
+    result_cache_lock = threading.Lock()
+
+    def get_or_compute(kind: str, cache_key: str, compute) -> Tuple[Any, str]:
+        """Return the cached `kind` result for `cache_key` and its ETag, computing both on a miss"""
+        key = hashkey(kind, cache_key)
+        with result_cache_lock:
+            entry = result_cache.get(key)
+        CACHE_LOOKUPS.labels(kind, 'miss' if entry is None else 'hit').inc()
+        if entry is None:
+            # compute() raises on failure, so errors never reach the cache. The ETag hashes the
+            # response body (app.json is orjson), so every worker agrees on it
+            data = compute()
+            etag = hashlib.blake2b(app.json.dumps(data).encode(), digest_size=16).hexdigest()
+            entry = (data, etag)
+            with result_cache_lock:
+                result_cache[key] = entry
+        return entry
+
+    def conditional_json(data: Any, etag: str, max_age: int = 120) -> Response:
+        """Serve `data` with HTTP caching headers, or an empty 304 if the client's copy is current"""
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = jsonify(data)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+        return response
+
+    def get_cached_metrics_summary(cache_key: str):
         """Cache for metrics summary with 2 minute TTL"""
-        return get_metrics_summary_internal()
+        return get_or_compute('summary', cache_key, get_metrics_summary_internal)
 
-    @lru_cache(maxsize=32)
-    def get_cached_metrics_trend(cache_key: str, ttl_hash: str):
+    def get_cached_metrics_trend(cache_key: str):
         """Cache for metrics trend with 2 minute TTL"""
-        return get_metrics_trend_internal()
+        return get_or_compute('trend', cache_key, get_metrics_trend_internal)
 
-    @lru_cache(maxsize=32)
-    def get_cached_recommendations(cache_key: str, ttl_hash: str):
+    def get_cached_recommendations(cache_key: str):
         """Cache for recommendations with 2 minute TTL"""
-        return get_recommendations_internal()
+        return get_or_compute('recommendations', cache_key, get_recommendations_internal)
+
+    # Cached result kinds grouped by the tables they are derived from
+    CACHE_DEPENDENCIES = {
+        'token_logs': ('summary', 'trend', 'recommendations'),
+        'model_pricing': ('recommendations',),
+        'model_alternatives': ('recommendations',)
+    }
+
+    def invalidate_table_caches(table: str) -> int:
+        """Drop every cached result that depends on `table`"""
+        kinds = CACHE_DEPENDENCIES.get(table, ())
+        with result_cache_lock:
+            for key in [key for key in result_cache if key[0] in kinds]:
+                result_cache.pop(key, None)
+        with reference_cache_lock:
+            reference_cache.pop(table, None)
+        if table == 'token_logs':
+            with filter_triples_lock:
+                filter_triples_cache.clear()
+        return len(kinds)
+
+    @app.route('/api/cache/invalidate', methods=['POST'])
+    def invalidate_cache():
+        """Invalidate cached results on writes (target for Supabase database webhooks)"""
+        secret = os.getenv('CACHE_WEBHOOK_SECRET')
+        provided = request.headers.get('X-Webhook-Secret', '')
+        if not secret or not hmac.compare_digest(provided, secret):
+            return jsonify({'error': 'Unauthorized'}), 401
 
-    # TTL hash generator (changes every 2 minutes)
-    def get_ttl_hash(minutes=2):
-        """Return the same value within `minutes` time period"""
-        return round(time.time() / (minutes * 60))
+        # Supabase webhooks post {"type": ..., "table": ..., "record": ...}
+        payload = request.get_json(silent=True) or {}
+        table = payload.get('table')
+        if table not in CACHE_DEPENDENCIES:
+            return jsonify({'error': f'Invalid table. Must be one of: {list(CACHE_DEPENDENCIES)}'}), 400
+
+        return jsonify({
+            'table': table,
+            'caches_cleared': invalidate_table_caches(table)
+        })
+
+    # Named so a token_logs webhook can clear it along with the result cache
+    filter_triples_cache = TTLCache(maxsize=1, ttl=300)
+    filter_triples_lock = threading.Lock()
+
+    @cached(filter_triples_cache, lock=filter_triples_lock)
+    def get_filter_triples() -> List[Dict[str, Any]]:
+        """Return the distinct (model, endpoint_name, api_provider) rows, cached for five minutes"""
+        rows = call_rpc('filter_triples', {})
+        if rows is not None:
+            return rows
+
+        # Function not deployed yet: fall back to reading every row, page by page
+        query = app.supabase.table('token_logs').select('model, endpoint_name, api_provider')
+        return list(chain.from_iterable(fetch_pages(
+            lambda row_range: orjson.loads(request_rows(query, 'application/json', row_range) or '[]')
+        )))
 
     @app.route('/api/filters')
     def get_filters():
         """Get available filter options with their relationships"""
         try:
-            # Get all unique values including nulls
-            response = app.supabase.table('token_logs').select('model, endpoint_name, api_provider').execute()
+            # Get all unique combinations including nulls
+            rows = get_filter_triples()
             
-            if not response.data:
+            if not rows:
                 return jsonify({
                     'models': [],
                     'endpoints': [],
@@ -472,63 +933,30 @@ def create_app():
                     }
                 })
 
-            # Build relationships
-            model_endpoints = {}  # model -> endpoints
-            model_providers = {}  # model -> providers
-            endpoint_providers = {}  # endpoint -> providers
-            provider_models = {}  # provider -> models
-            provider_endpoints = {}  # provider -> endpoints
-            endpoint_models = {}  # endpoint -> models
-
-            # Process each log to build relationships
-            for row in response.data:
-                model = str(row.get('model', 'None'))
-                endpoint = str(row.get('endpoint_name', 'None'))
-                provider = str(row.get('api_provider', 'None'))
-
-                # Model relationships
-                if model not in model_endpoints:
-                    model_endpoints[model] = set()
-                model_endpoints[model].add(endpoint)
-
-                if model not in model_providers:
-                    model_providers[model] = set()
-                model_providers[model].add(provider)
-
-                # Endpoint relationships
-                if endpoint not in endpoint_providers:
-                    endpoint_providers[endpoint] = set()
-                endpoint_providers[endpoint].add(provider)
-
-                if endpoint not in endpoint_models:
-                    endpoint_models[endpoint] = set()
-                endpoint_models[endpoint].add(model)
-
-                # Provider relationships
-                if provider not in provider_models:
-                    provider_models[provider] = set()
-                provider_models[provider].add(model)
-
-                if provider not in provider_endpoints:
-                    provider_endpoints[provider] = set()
-                provider_endpoints[provider].add(endpoint)
-
-            # Convert sets to sorted lists
+            # Reduce to distinct (model, endpoint, provider) triples, keeping nulls as 'None'
+            triples = pd.DataFrame(
+                to_columns(rows, ['model', 'endpoint_name', 'api_provider'])
+            ).astype(str).drop_duplicates()
+            
+            def relationship(key: str, value: str) -> Dict[str, List[str]]:
+                # Sorting by value first means each group's unique values already come out in order
+                return {k: v.tolist() for k, v in triples.sort_values(value).groupby(key)[value].unique().items()}
+            
             relationships = {
-                'model_endpoints': {k: sorted(list(v)) for k, v in model_endpoints.items()},
-                'model_providers': {k: sorted(list(v)) for k, v in model_providers.items()},
-                'endpoint_providers': {k: sorted(list(v)) for k, v in endpoint_providers.items()},
-                'provider_models': {k: sorted(list(v)) for k, v in provider_models.items()},
-                'provider_endpoints': {k: sorted(list(v)) for k, v in provider_endpoints.items()},
-                'endpoint_models': {k: sorted(list(v)) for k, v in endpoint_models.items()}
+                'model_endpoints': relationship('model', 'endpoint_name'),
+                'model_providers': relationship('model', 'api_provider'),
+                'endpoint_providers': relationship('endpoint_name', 'api_provider'),
+                'provider_models': relationship('api_provider', 'model'),
+                'provider_endpoints': relationship('api_provider', 'endpoint_name'),
+                'endpoint_models': relationship('endpoint_name', 'model')
             }
 
-            # Get unique values preserving nulls
-            unique_models = sorted(list(model_endpoints.keys()))
-            unique_endpoints = sorted(list(endpoint_providers.keys()))
-            unique_providers = sorted(list(provider_models.keys()))
+            # Get unique values preserving nulls; groupby already yields sorted keys
+            unique_models = list(relationships['model_endpoints'])
+            unique_endpoints = list(relationships['endpoint_providers'])
+            unique_providers = list(relationships['provider_models'])
 
-            return jsonify({
+            response = jsonify({
                 'models': unique_models,
                 'endpoints': unique_endpoints,
                 'providers': unique_providers,
@@ -542,18 +970,19 @@ def create_app():
                     'combine_filters': '?granularity=month&model=gpt-4&endpoint=chat&provider=OpenAI'
                 }
             })
+            response.headers['Cache-Control'] = 'public, max-age=300'
+            response.add_etag()
+            return response.make_conditional(request)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
     @app.route('/api/health')
     def health_check():
         """Health check endpoint"""
-        process = psutil.Process(os.getpid())
-        memory_percent = process.memory_percent()
+        memory_percent = mem_pct()
         
         if memory_percent > 90:  # Critical memory usage
             cleanup_cache()  # Force cache cleanup
-            gc.collect()
         
         return jsonify({
             'status': 'healthy',
@@ -565,23 +994,13 @@ def create_app():
     def get_metrics_summary():
         """Get summary metrics with filters"""
         try:
-            # Parse filters
-            filters = parse_filters()
-            
             # Generate cache key from filters
-            cache_key = make_cache_key(
-                'summary',
-                filters.start_date.isoformat(),
-                filters.end_date.isoformat(),
-                *sorted(filters.models or []),
-                *sorted(filters.endpoints or []),
-                *sorted(filters.providers or [])
-            )
+            cache_key = request_cache_key('summary')
             
             # Get cached or fresh data
-            data = get_cached_metrics_summary(cache_key, get_ttl_hash())
+            data, etag = get_cached_metrics_summary(cache_key)
             
-            return jsonify(data)
+            return conditional_json(data, etag)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -589,26 +1008,46 @@ def create_app():
     def get_metrics_trend():
         """Get metrics trend with filters"""
         try:
-            # Parse filters
-            filters = parse_filters()
-            
             # Generate cache key from filters
-            cache_key = make_cache_key(
-                'trend',
-                filters.start_date.isoformat(),
-                filters.end_date.isoformat(),
-                *sorted(filters.models or []),
-                *sorted(filters.endpoints or []),
-                *sorted(filters.providers or [])
-            )
+            cache_key = request_cache_key('trend')
             
             # Get cached or fresh data
-            data = get_cached_metrics_trend(cache_key, get_ttl_hash())
+            data, etag = get_cached_metrics_trend(cache_key)
             
-            return jsonify(data)
+            return conditional_json(data, etag)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    def aggregate_metrics_by_model(start_iso: str, end_iso: str) -> List[Dict[str, Any]]:
+        """Aggregate per-model metrics from raw token_logs rows"""
+        # Query data using table API, as columns
+        df = fetch_all_metrics(app.supabase.table('token_logs').select(
+            'model',
+            'total_cost',
+            'total_tokens',
+            'endpoint_name',
+            'api_provider'
+        ).gte(
+            'timestamp', 
+            start_iso
+        ).lte(
+            'timestamp',
+            end_iso
+        ), ['model', 'endpoint_name', 'api_provider'])
+        
+        if df.empty:
+            return []
+        
+        # Aggregate data by model with a columnar groupby
+        grouped = df.groupby('model', sort=False, dropna=False).agg(
+            total_spend=('total_cost', 'sum'),
+            total_requests=('total_cost', 'size'),
+            total_tokens=('total_tokens', 'sum'),
+            endpoints_used=('endpoint_name', sorted_unique),
+            providers_used=('api_provider', sorted_unique)
+        )
+        return grouped.rename_axis('model').reset_index().to_dict('records')
+
     @app.route('/api/metrics/by-model')
     def get_metrics_by_model():
         """Get metrics breakdown by model for the last 12 months"""
@@ -617,54 +1056,13 @@ def create_app():
             end_date = datetime.now(UTC)
             start_date = end_date - timedelta(days=365)
             
-            # Query data using table API
-            response = app.supabase.table('token_logs').select(
-                'model',
-                'total_cost',
-                'total_tokens',
-                'endpoint_name',
-                'api_provider'
-            ).gte(
-                'timestamp', 
-                start_date.isoformat()
-            ).lte(
-                'timestamp',
-                end_date.isoformat()
-            ).execute()
-            
-            if not response.data:
-                return jsonify({
-                    'metrics': [],
-                    'period': 'last 12 months'
-                })
+            start_iso = start_date.isoformat()
+            end_iso = end_date.isoformat()
             
-            # Aggregate data by model
-            model_metrics = {}
-            for row in response.data:
-                model = row['model']
-                if model not in model_metrics:
-                    model_metrics[model] = {
-                        'model': model,
-                        'total_spend': 0,
-                        'total_requests': 0,
-                        'total_tokens': 0,
-                        'endpoints_used': set(),
-                        'providers_used': set()
-                    }
-                
-                metrics = model_metrics[model]
-                metrics['total_spend'] += float(row['total_cost'])
-                metrics['total_requests'] += 1
-                metrics['total_tokens'] += int(row['total_tokens'])
-                metrics['endpoints_used'].add(row['endpoint_name'])
-                metrics['providers_used'].add(row['api_provider'])
-            
-            # Convert sets to lists and prepare final result
-            result = []
-            for metrics in model_metrics.values():
-                metrics['endpoints_used'] = sorted(list(metrics['endpoints_used']))
-                metrics['providers_used'] = sorted(list(metrics['providers_used']))
-                result.append(metrics)
+            # Aggregate in the database, falling back to raw rows if the function isn't deployed
+            result = call_rpc('metrics_by_model', {'start_date': start_iso, 'end_date': end_iso})
+            if result is None:
+                result = aggregate_metrics_by_model(start_iso, end_iso)
             
             # Sort by total spend
             result.sort(key=lambda x: x['total_spend'], reverse=True)
@@ -674,10 +1072,39 @@ def create_app():
                 'period': 'last 12 months'
             })
         except Exception as e:
-            print(f"Error in metrics by model: {str(e)}")
-            print(f"Full error details: {repr(e)}")
+            logger.exception("Error in metrics by model")
             return jsonify({'error': str(e)}), 500
 
+    def aggregate_metrics_by_endpoint(start_iso: str, end_iso: str) -> List[Dict[str, Any]]:
+        """Aggregate per-endpoint metrics from raw token_logs rows"""
+        # Query data using table API, as columns
+        df = fetch_all_metrics(app.supabase.table('token_logs').select(
+            'endpoint_name',
+            'total_cost',
+            'total_tokens',
+            'model',
+            'api_provider'
+        ).gte(
+            'timestamp', 
+            start_iso
+        ).lte(
+            'timestamp',
+            end_iso
+        ), ['endpoint_name', 'model', 'api_provider'])
+        
+        if df.empty:
+            return []
+        
+        # Aggregate data by endpoint with a columnar groupby
+        grouped = df.groupby('endpoint_name', sort=False, dropna=False).agg(
+            total_spend=('total_cost', 'sum'),
+            total_requests=('total_cost', 'size'),
+            total_tokens=('total_tokens', 'sum'),
+            models_used=('model', sorted_unique),
+            providers_used=('api_provider', sorted_unique)
+        )
+        return grouped.rename_axis('endpoint').reset_index().to_dict('records')
+
     @app.route('/api/metrics/by-endpoint')
     def get_metrics_by_endpoint():
         """Get metrics breakdown by endpoint for the last 12 months"""
@@ -686,54 +1113,13 @@ def create_app():
             end_date = datetime.now(UTC)
             start_date = end_date - timedelta(days=365)
             
-            # Query data using table API
-            response = app.supabase.table('token_logs').select(
-                'endpoint_name',
-                'total_cost',
-                'total_tokens',
-                'model',
-                'api_provider'
-            ).gte(
-                'timestamp', 
-                start_date.isoformat()
-            ).lte(
-                'timestamp',
-                end_date.isoformat()
-            ).execute()
-            
-            if not response.data:
-                return jsonify({
-                    'metrics': [],
-                    'period': 'last 12 months'
-                })
+            start_iso = start_date.isoformat()
+            end_iso = end_date.isoformat()
             
-            # Aggregate data by endpoint
-            endpoint_metrics = {}
-            for row in response.data:
-                endpoint = row['endpoint_name']
-                if endpoint not in endpoint_metrics:
-                    endpoint_metrics[endpoint] = {
-                        'endpoint': endpoint,
-                        'total_spend': 0,
-                        'total_requests': 0,
-                        'total_tokens': 0,
-                        'models_used': set(),
-                        'providers_used': set()
-                    }
-                
-                metrics = endpoint_metrics[endpoint]
-                metrics['total_spend'] += float(row['total_cost'])
-                metrics['total_requests'] += 1
-                metrics['total_tokens'] += int(row['total_tokens'])
-                metrics['models_used'].add(row['model'])
-                metrics['providers_used'].add(row['api_provider'])
-            
-            # Convert sets to lists and prepare final result
-            result = []
-            for metrics in endpoint_metrics.values():
-                metrics['models_used'] = sorted(list(metrics['models_used']))
-                metrics['providers_used'] = sorted(list(metrics['providers_used']))
-                result.append(metrics)
+            # Aggregate in the database, falling back to raw rows if the function isn't deployed
+            result = call_rpc('metrics_by_endpoint', {'start_date': start_iso, 'end_date': end_iso})
+            if result is None:
+                result = aggregate_metrics_by_endpoint(start_iso, end_iso)
             
             # Sort by total spend
             result.sort(key=lambda x: x['total_spend'], reverse=True)
@@ -743,13 +1129,33 @@ def create_app():
                 'period': 'last 12 months'
             })
         except Exception as e:
-            print(f"Error in metrics by endpoint: {str(e)}")
-            print(f"Full error details: {repr(e)}")
+            logger.exception("Error in metrics by endpoint")
             return jsonify({'error': str(e)}), 500
 
-    def get_model_usage_metrics(start_date: str, end_date: str, models: Optional[List[str]] = None) -> Dict[str, ModelMetrics]:
+    def get_model_usage_metrics(start_date: str, end_date: str, models: Optional[Sequence[str]] = None) -> Dict[str, ModelMetrics]:
         """Get usage metrics for models in the given date range"""
         try:
+            # Aggregate in the database when the function is deployed
+            rows = call_rpc('model_usage_metrics', {
+                'start_date': start_date,
+                'end_date': end_date,
+                'models': list(models) if models else None
+            })
+            if rows is not None:
+                return {
+                    # The function COALESCEs every sum to a float8/bigint, so values need no casting
+                    row['model']: {
+                        'total_spend': row['total_spend'],
+                        'total_requests': row['total_requests'],
+                        'total_tokens': row['total_tokens'],
+                        'prompt_tokens': row['prompt_tokens'],
+                        'completion_tokens': row['completion_tokens'],
+                        'input_cost': row['input_cost'],
+                        'output_cost': row['output_cost'],
+                        'avg_latency': row['avg_latency']
+                    } for row in rows
+                }
+            
             # Build query with filters
             query = app.supabase.table('token_logs').select(
                 'model',
@@ -770,78 +1176,99 @@ def create_app():
             if models:
                 query = query.in_('model', models)
             
-            # Execute query
-            response = query.execute()
-            
-            if not response.data:
+            # Fetch as CSV columns and aggregate per model in one vectorized groupby
+            df = fetch_all_metrics(
+                query,
+                ['model'],
+                numeric_columns=USAGE_METRIC_COLUMNS,
+                nullable_columns=['latency_ms']
+            )
+            if df.empty:
                 return {}
-            
-            # Calculate metrics per model
-            model_metrics = {}
-            for row in response.data:
-                model = row['model']
-                if model not in model_metrics:
-                    model_metrics[model] = {
-                        'total_spend': 0,
-                        'total_requests': 0,
-                        'total_tokens': 0,
-                        'prompt_tokens': 0,
-                        'completion_tokens': 0,
-                        'input_cost': 0,
-                        'output_cost': 0,
-                        'avg_latency': 0,
-                        'latency_samples': 0
-                    }
-                
-                metrics = model_metrics[model]
-                metrics['total_spend'] += float(row['total_cost'])
-                metrics['total_requests'] += 1
-                metrics['total_tokens'] += int(row['total_tokens'])
-                metrics['prompt_tokens'] += int(row['prompt_tokens'])
-                metrics['completion_tokens'] += int(row['completion_tokens'])
-                metrics['input_cost'] += float(row['input_cost'])
-                metrics['output_cost'] += float(row['output_cost'])
-                
-                # Handle latency calculation
-                if row['latency_ms'] is not None:
-                    latency = float(row['latency_ms'])
-                    current_avg = metrics['avg_latency']
-                    current_samples = metrics['latency_samples']
-                    
-                    # Update running average
-                    metrics['avg_latency'] = (current_avg * current_samples + latency) / (current_samples + 1)
-                    metrics['latency_samples'] += 1
-                
-            # Clean up latency calculation
-            for metrics in model_metrics.values():
-                if metrics['latency_samples'] == 0:
-                    metrics['avg_latency'] = 0
-                del metrics['latency_samples']
+            grouped = df.groupby('model', sort=False, dropna=False).agg(
+                total_spend=('total_cost', 'sum'),
+                total_requests=('total_cost', 'size'),
+                total_tokens=('total_tokens', 'sum'),
+                prompt_tokens=('prompt_tokens', 'sum'),
+                completion_tokens=('completion_tokens', 'sum'),
+                input_cost=('input_cost', 'sum'),
+                output_cost=('output_cost', 'sum'),
+                avg_latency=('latency_ms', 'mean')  # Over rows that report latency
+            )
+            grouped['avg_latency'] = grouped['avg_latency'].fillna(0)
+            
+            model_metrics = {
+                None if pd.isna(model) else model: {
+                    'total_spend': float(metrics['total_spend']),
+                    'total_requests': int(metrics['total_requests']),
+                    'total_tokens': int(metrics['total_tokens']),
+                    'prompt_tokens': int(metrics['prompt_tokens']),
+                    'completion_tokens': int(metrics['completion_tokens']),
+                    'input_cost': float(metrics['input_cost']),
+                    'output_cost': float(metrics['output_cost']),
+                    'avg_latency': float(metrics['avg_latency'])
+                } for model, metrics in grouped.to_dict('index').items()
+            }
             
             return model_metrics
-        except Exception as e:
-            print(f"Error in get_model_usage_metrics: {str(e)}")
-            print(f"Full error details: {repr(e)}")
-            return {}
+        except Exception:
+            logger.exception("Error in get_model_usage_metrics")
+            raise
+
+    def summary_from_aggregates(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the summary response from metrics_summary rows"""
+        breakdowns = {'provider': {}, 'model': {}, 'endpoint': {}}
+        for row in rows:
+            # metrics_summary COALESCEs its sums, so values arrive as non-NULL float8/bigint
+            breakdowns[row['dimension']][row['name']] = {
+                'total_spend': row['total_spend'],
+                'total_requests': row['total_requests'],
+                'total_tokens': row['total_tokens']
+            }
+
+        # Every row lands in exactly one provider group, so those sum to the totals
+        total_spend = sum(metrics['total_spend'] for metrics in breakdowns['provider'].values())
+        total_requests = sum(metrics['total_requests'] for metrics in breakdowns['provider'].values())
+        return {
+            'total_spend': total_spend,
+            'total_requests': total_requests,
+            'avg_cost_per_request': total_spend / total_requests if total_requests > 0 else 0,
+            'provider_breakdown': breakdowns['provider'],
+            'model_breakdown': breakdowns['model'],
+            'endpoint_breakdown': breakdowns['endpoint'],
+            'period': 'filtered'
+        }
+
+    def breakdown(accumulators: Dict[Any, List]) -> Dict[Any, Dict[str, Any]]:
+        """Expand [spend, requests, tokens] accumulators into the response shape"""
+        return {
+            key: {'total_spend': spend, 'total_requests': requests, 'total_tokens': tokens}
+            for key, (spend, requests, tokens) in accumulators.items()
+        }
 
     def get_metrics_summary_internal():
         """Internal function to get metrics summary from database"""
         try:
             # Parse filters
             filters = parse_filters()
+
+            # Aggregate in Postgres when the summary function is deployed
+            rows = query_agg(filters, 'metrics_summary')
+            if rows is not None:
+                return summary_from_aggregates(rows)
             
-            # Build base query with filters
+            # Build base query with filters, casting numerics server-side
             query = app.supabase.table('token_logs').select(
-                'total_cost',
-                'total_tokens',
+                'total_cost::float8',
+                'total_tokens::int8',
                 'api_provider',
                 'model',
                 'endpoint_name'
             )
             
             # Apply filters
-            query = query.gte('timestamp', filters.start_date.isoformat())
-            query = query.lt('timestamp', filters.end_date.isoformat())
+            query = query.gte('timestamp', filters.start_iso)
+            query = query.lt('timestamp', filters.end_iso)
             
             if filters.models:
                 query = query.in_('model', filters.models)
@@ -850,331 +1277,272 @@ def create_app():
             if filters.providers:
                 query = query.in_('api_provider', filters.providers)
 
-            # Initialize aggregation dictionaries
-            provider_metrics = {}
-            model_metrics = {}
-            endpoint_metrics = {}
-            total_spend = 0
-            total_requests = 0
-            
-            # Process data in chunks
-            page_size = 5000
-            start = 0
-            
-            while True:
-                response = query.range(start, start + page_size - 1).execute()
-                if not response.data:
-                    break
-                    
-                # Process chunk
-                for row in response.data:
-                    spend = float(row['total_cost'] or 0)
-                    tokens = int(row['total_tokens'] or 0)
-                    
-                    # Update totals
-                    total_spend += spend
-                    total_requests += 1
-                    
-                    # Update provider metrics
-                    provider = row['api_provider']
-                    if provider not in provider_metrics:
-                        provider_metrics[provider] = {'total_spend': 0, 'total_requests': 0, 'total_tokens': 0}
-                    provider_metrics[provider]['total_spend'] += spend
-                    provider_metrics[provider]['total_requests'] += 1
-                    provider_metrics[provider]['total_tokens'] += tokens
-                    
-                    # Update model metrics
-                    model = row['model']
-                    if model not in model_metrics:
-                        model_metrics[model] = {'total_spend': 0, 'total_requests': 0, 'total_tokens': 0}
-                    model_metrics[model]['total_spend'] += spend
-                    model_metrics[model]['total_requests'] += 1
-                    model_metrics[model]['total_tokens'] += tokens
-                    
-                    # Update endpoint metrics
-                    endpoint = row['endpoint_name']
-                    if endpoint not in endpoint_metrics:
-                        endpoint_metrics[endpoint] = {'total_spend': 0, 'total_requests': 0, 'total_tokens': 0}
-                    endpoint_metrics[endpoint]['total_spend'] += spend
-                    endpoint_metrics[endpoint]['total_requests'] += 1
-                    endpoint_metrics[endpoint]['total_tokens'] += tokens
+            # Initialize aggregation accumulators as [spend, requests, tokens]
+            provider_metrics = defaultdict(lambda: [0.0, 0, 0])
+            model_metrics = defaultdict(lambda: [0.0, 0, 0])
+            endpoint_metrics = defaultdict(lambda: [0.0, 0, 0])
+            
+            # Process data in chunks, fetching several pages at once
+            label_keys = ['api_provider', 'model', 'endpoint_name']
+            for df in fetch_pages(lambda row_range: fetch_metrics_frame(query, label_keys, row_range)):
+                # The CSV parser already zero-filled NULL costs/tokens column-wise
+                costs = df['total_cost'].to_numpy()
+                token_counts = df['total_tokens'].to_numpy()
                 
-                # Move to next page
-                start += page_size
+                # Process chunk: sum each dimension by integer group code in compiled bincount loops
+                for accumulators, key in (
+                    (provider_metrics, 'api_provider'),
+                    (model_metrics, 'model'),
+                    (endpoint_metrics, 'endpoint_name')
+                ):
+                    codes, groups = factorize_labels(df[key].to_numpy())
+                    spend = np.bincount(codes, weights=costs, minlength=len(groups)).tolist()
+                    requests = np.bincount(codes, minlength=len(groups)).tolist()
+                    tokens = np.bincount(codes, weights=token_counts, minlength=len(groups)).astype(np.int64).tolist()
+                    for i, group in enumerate(groups):
+                        totals = accumulators[group]
+                        totals[0] += spend[i]
+                        totals[1] += requests[i]
+                        totals[2] += tokens[i]
                 
-                # Force garbage collection between chunks
-                gc.collect()
+                # Release this page so only the in-flight pages stay alive
+                del df, costs, token_counts
 
+            # Every row lands in exactly one provider group, so those sum to the totals
+            total_spend = sum(spend for spend, _, _ in provider_metrics.values())
+            total_requests = sum(requests for _, requests, _ in provider_metrics.values())
             return {
                 'total_spend': total_spend,
                 'total_requests': total_requests,
                 'avg_cost_per_request': total_spend / total_requests if total_requests > 0 else 0,
-                'provider_breakdown': provider_metrics,
-                'model_breakdown': model_metrics,
-                'endpoint_breakdown': endpoint_metrics,
-                'period': 'filtered'
-            }
-        except Exception as e:
-            print(f"Error in get_metrics_summary_internal: {str(e)}")
-            return {
-                'error': str(e),
-                'total_spend': 0,
-                'total_requests': 0,
-                'avg_cost_per_request': 0,
-                'provider_breakdown': {},
-                'model_breakdown': {},
-                'endpoint_breakdown': {},
+                'provider_breakdown': breakdown(provider_metrics),
+                'model_breakdown': breakdown(model_metrics),
+                'endpoint_breakdown': breakdown(endpoint_metrics),
                 'period': 'filtered'
             }
+        except Exception:
+            logger.exception("Error in get_metrics_summary_internal")
+            raise
+
+    def aggregate_trend_from_rollup(filters: FilterParams, time_buckets: Dict[str, Dict[str, Any]]) -> bool:
+        """Fill time buckets from the hourly rollup, returning False if it isn't deployed"""
+        rows = query_agg(filters, 'metrics_trend', granularity=filters.time_granularity.value)
+        if rows is None:
+            return False
+
+        for row in rows:
+            bucket = time_buckets.get(row['period'])
+            if bucket is None:
+                continue
+            # metrics_trend already returns float8/bigint sums, never NULL
+            bucket['total_spend'] += row['total_spend']
+            bucket['total_requests'] += row['total_requests']
+            bucket['total_tokens'] += row['total_tokens']
+        return True
+
+    def aggregate_trend_from_logs(filters: FilterParams, time_buckets: Dict[str, Dict[str, Any]]) -> None:
+        """Aggregate raw token_logs rows into the pre-built time buckets"""
+        # Build base query, casting numerics server-side so values arrive as plain floats/ints
+        query = app.supabase.table('token_logs').select(
+            'timestamp',
+            'total_cost::float8',
+            'total_tokens::int8'
+        )
+        
+        # Apply filters
+        query = query.gte('timestamp', filters.start_iso)
+        query = query.lt('timestamp', filters.end_iso)
+        
+        if filters.models:
+            query = query.in_('model', filters.models)
+        if filters.endpoints:
+            query = query.in_('endpoint_name', filters.endpoints)
+        if filters.providers:
+            query = query.in_('api_provider', filters.providers)
+        
+        # Process data in chunks, fetching several pages at once
+        total_rows = 0
+        
+        for df in fetch_pages(lambda row_range: fetch_metrics_frame(query, ['timestamp'], row_range)):
+            chunk_size = len(df)
+            total_rows += chunk_size
+            logger.debug("Processing chunk of %d rows (total so far: %d)", chunk_size, total_rows)
+            
+            # Bucket and sum the chunk in one vectorized groupby
+            df['bucket'] = trend_bucket_keys(df['timestamp'], filters.time_granularity)
+            grouped = df.groupby('bucket', sort=False).agg(
+                total_spend=('total_cost', 'sum'),
+                total_requests=('total_cost', 'size'),
+                total_tokens=('total_tokens', 'sum')
+            )
+            
+            for bucket_key, totals in grouped.to_dict('index').items():
+                if bucket_key in time_buckets:
+                    time_buckets[bucket_key]['total_spend'] += totals['total_spend']
+                    time_buckets[bucket_key]['total_requests'] += totals['total_requests']
+                    time_buckets[bucket_key]['total_tokens'] += totals['total_tokens']
+                else:
+                    logger.debug("%d data points in %s fall outside bucket range", totals['total_requests'], bucket_key)
+            
+            # Release this page so only the in-flight pages stay alive
+            del df, grouped
+        
+        logger.debug("Processed %d total rows", total_rows)
 
     def get_metrics_trend_internal():
         """Internal function to get metrics trend from database"""
         try:
             # Parse filters
             filters = parse_filters()
-            print(f"Trend filters - start: {filters.start_date}, end: {filters.end_date}, granularity: {filters.time_granularity}")
+            logger.debug("Trend filters - start: %s, end: %s, granularity: %s", filters.start_date, filters.end_date, filters.time_granularity)
             
-            # Initialize time buckets
+            # Build the output rows in chronological order while stepping from the start
+            # of the first bucket; time_buckets indexes the same dicts by bucket key
+            bucket_start = BUCKET_START[filters.time_granularity]
+            next_bucket = NEXT_BUCKET[filters.time_granularity]
+            label_format = PERIOD_LABEL_FORMATS[filters.time_granularity]
+            metrics = []
             time_buckets = {}
-            current = filters.start_date
+            current = bucket_start(filters.start_date)
             while current < filters.end_date:
-                # Create bucket key based on granularity
-                if filters.time_granularity == TimeGranularity.HOUR:
-                    bucket_key = current.strftime('%Y-%m-%d %H:00:00')
-                elif filters.time_granularity == TimeGranularity.DAY:
-                    bucket_key = current.strftime('%Y-%m-%d 00:00:00')
-                elif filters.time_granularity == TimeGranularity.WEEK:
-                    # Get start of week
-                    week_start = current - timedelta(days=current.weekday())
-                    bucket_key = week_start.strftime('%Y-%m-%d 00:00:00')
-                elif filters.time_granularity == TimeGranularity.MONTH:
-                    bucket_key = current.strftime('%Y-%m-01 00:00:00')
-                else:  # YEAR
-                    bucket_key = current.strftime('%Y-01-01 00:00:00')
-                
-                time_buckets[bucket_key] = {
+                bucket_key = current.strftime('%Y-%m-%d %H:00:00')
+                bucket = {
+                    'period': bucket_key,
+                    'period_label': current.strftime(label_format),
                     'total_spend': 0,
                     'total_requests': 0,
-                    'total_tokens': 0
-                }
-                
-                # Increment current based on granularity
-                if filters.time_granularity == TimeGranularity.HOUR:
-                    current += timedelta(hours=1)
-                elif filters.time_granularity == TimeGranularity.DAY:
-                    current += timedelta(days=1)
-                elif filters.time_granularity == TimeGranularity.WEEK:
-                    current += timedelta(weeks=1)
-                elif filters.time_granularity == TimeGranularity.MONTH:
-                    if current.month == 12:
-                        current = current.replace(year=current.year + 1, month=1)
-                    else:
-                        current = current.replace(month=current.month + 1)
-                else:  # YEAR
-                    current = current.replace(year=current.year + 1)
-            
-            print(f"Created {len(time_buckets)} time buckets")
-            
-            # Build base query
-            query = app.supabase.table('token_logs').select(
-                'timestamp',
-                'total_cost',
-                'total_tokens'
-            )
-            
-            # Apply filters
-            query = query.gte('timestamp', filters.start_date.isoformat())
-            query = query.lt('timestamp', filters.end_date.isoformat())
-            
-            if filters.models:
-                query = query.in_('model', filters.models)
-            if filters.endpoints:
-                query = query.in_('endpoint_name', filters.endpoints)
-            if filters.providers:
-                query = query.in_('api_provider', filters.providers)
-            
-            # Process data in chunks
-            page_size = 5000
-            start = 0
-            total_rows = 0
-            
-            while True:
-                response = query.range(start, start + page_size - 1).execute()
-                if not response.data:
-                    break
-                
-                chunk_size = len(response.data)
-                total_rows += chunk_size
-                print(f"Processing chunk of {chunk_size} rows (total so far: {total_rows})")
-                
-                # Process chunk
-                for row in response.data:
-                    timestamp = datetime.fromisoformat(row['timestamp'].replace('Z', '+00:00'))
-                    
-                    # Create bucket key based on granularity
-                    if filters.time_granularity == TimeGranularity.HOUR:
-                        bucket_key = timestamp.strftime('%Y-%m-%d %H:00:00')
-                    elif filters.time_granularity == TimeGranularity.DAY:
-                        bucket_key = timestamp.strftime('%Y-%m-%d 00:00:00')
-                    elif filters.time_granularity == TimeGranularity.WEEK:
-                        # Get start of week
-                        week_start = timestamp - timedelta(days=timestamp.weekday())
-                        bucket_key = week_start.strftime('%Y-%m-%d 00:00:00')
-                    elif filters.time_granularity == TimeGranularity.MONTH:
-                        bucket_key = timestamp.strftime('%Y-%m-01 00:00:00')
-                    else:  # YEAR
-                        bucket_key = timestamp.strftime('%Y-01-01 00:00:00')
-                    
-                    if bucket_key in time_buckets:
-                        time_buckets[bucket_key]['total_spend'] += float(row['total_cost'] or 0)
-                        time_buckets[bucket_key]['total_requests'] += 1
-                        time_buckets[bucket_key]['total_tokens'] += int(row['total_tokens'] or 0)
-                    else:
-                        print(f"Warning: Data point at {timestamp} ({bucket_key}) falls outside bucket range")
-                
-                # Move to next page
-                start += page_size
-                
-                # Force garbage collection between chunks
-                gc.collect()
-            
-            print(f"Processed {total_rows} total rows")
-            
-            # Convert buckets to sorted list
-            metrics = []
-            for bucket_key, bucket_metrics in sorted(time_buckets.items()):
-                # Format the period label based on granularity
-                try:
-                    timestamp = datetime.strptime(bucket_key, '%Y-%m-%d %H:00:00')
-                    if filters.time_granularity == TimeGranularity.HOUR:
-                        period_label = timestamp.strftime('%I %p')
-                    elif filters.time_granularity == TimeGranularity.DAY:
-                        period_label = timestamp.strftime('%b %d')
-                    elif filters.time_granularity == TimeGranularity.WEEK:
-                        period_label = f"Week of {timestamp.strftime('%b %d')}"
-                    elif filters.time_granularity == TimeGranularity.MONTH:
-                        period_label = timestamp.strftime('%b %Y')
-                    else:  # YEAR
-                        period_label = timestamp.strftime('%Y')
-                except ValueError as e:
-                    print(f"Error parsing date {bucket_key}: {str(e)}")
-                    period_label = bucket_key
-
-                metrics.append({
-                    'period': bucket_key,
-                    'period_label': period_label,
-                    'total_spend': bucket_metrics['total_spend'],
-                    'total_requests': bucket_metrics['total_requests'],
-                    'total_tokens': bucket_metrics['total_tokens'],
+                    'total_tokens': 0,
                     'models_used': [],  # We'll add this later if needed
                     'endpoints_used': [],  # We'll add this later if needed
                     'providers_used': []  # We'll add this later if needed
-                })
+                }
+                metrics.append(bucket)
+                time_buckets[bucket_key] = bucket
+                current = next_bucket(current)
+            
+            logger.debug("Created %d time buckets", len(time_buckets))
+            
+            # Prefer the hourly rollup; fall back to scanning raw rows
+            if not aggregate_trend_from_rollup(filters, time_buckets):
+                aggregate_trend_from_logs(filters, time_buckets)
             
-            print(f"Returning {len(metrics)} metrics buckets")
+            logger.debug("Returning %d metrics buckets", len(metrics))
             return {
                 'metrics': metrics,
                 'period': filters.time_granularity.value
             }
-        except Exception as e:
-            print(f"Error in get_metrics_trend_internal: {str(e)}")
-            print(f"Full error details: {repr(e)}")
-            return {
-                'error': str(e),
-                'metrics': [],
-                'period': filters.time_granularity.value
-            }
+        except Exception:
+            logger.exception("Error in get_metrics_trend_internal")
+            raise
+
+    # model_pricing and model_alternatives change a few times a month. The invalidation
+    # webhook only clears the worker it reaches, so keep the TTL short for the others
+    reference_cache = TTLCache(maxsize=8, ttl=int(os.getenv('REFERENCE_CACHE_TTL', '300')))
+    reference_cache_lock = threading.Lock()
+
+    def get_reference(table: str, load):
+        """Return the cached data derived from reference `table`, loading it on a miss"""
+        with reference_cache_lock:
+            value = reference_cache.get(table)
+        if value is not None:
+            CACHE_LOOKUPS.labels(table, 'hit').inc()
+            return value
+
+        CACHE_LOOKUPS.labels(table, 'miss').inc()
+        value = load()
+        with reference_cache_lock:
+            reference_cache[table] = value
+        return value
+
+    def load_price_lookup() -> Dict[str, Dict[str, float]]:
+        """Read active input/output prices keyed by model"""
+        pricing = app.supabase.table('model_pricing').select(
+            'model',
+            'input_price',
+            'output_price'
+        ).eq('is_active', True).execute()
+        return {
+            row['model']: {
+                'input_price': row['input_price'],
+                'output_price': row['output_price']
+            } for row in pricing.data
+        }
+
+    def load_recommended_alternatives() -> List[Dict[str, Any]]:
+        """Read the recommended (source_model, alternative_model, similarity_score) rows"""
+        return app.supabase.table('model_alternatives').select(
+            'source_model',
+            'alternative_model',
+            'similarity_score'
+        ).eq('is_recommended', True).execute().data
 
     def analyze_model_usage(metrics: Dict[str, ModelMetrics]) -> List[Recommendation]:
         recommendations: List[Recommendation] = []
         
         try:
-            # Get model alternatives
-            alternatives = app.supabase.table('model_alternatives').select(
-                'source_model',
-                'alternative_model',
-                'similarity_score'
-            ).eq('is_recommended', True).execute()
-            
-            # Get pricing data
-            pricing = app.supabase.table('model_pricing').select(
-                'model',
-                'input_price',
-                'output_price'
-            ).eq('is_active', True).execute()
-            
-            # Build pricing lookup
-            price_lookup = {
-                row['model']: {
-                    'input_price': row['input_price'],
-                    'output_price': row['output_price']
-                } for row in pricing.data
-            }
+            # Get model alternatives and pricing data in parallel (both are usually cached)
+            alternatives, price_lookup = run_concurrently(
+                lambda: get_reference('model_alternatives', load_recommended_alternatives),
+                lambda: get_reference('model_pricing', load_price_lookup)
+            )
+            
+            # Index priced alternatives by source model in one pass
+            alts_by_source = defaultdict(list)
+            for alt in alternatives:
+                alt_pricing = price_lookup.get(alt['alternative_model'])
+                if alt_pricing:
+                    alts_by_source[alt['source_model']].append((
+                        alt['alternative_model'],
+                        alt['similarity_score'],
+                        alt_pricing['input_price'],
+                        alt_pricing['output_price']
+                    ))
             
             # Process each model's metrics
             for model, model_metrics in metrics.items():
-                # Find alternatives for this model
-                model_alts = [alt for alt in alternatives.data if alt['source_model'] == model]
+                current_pricing = price_lookup.get(model)
+                model_alts = alts_by_source.get(model)
+                if not current_pricing or not model_alts:
+                    continue
+
+                # Calculate savings against every alternative at once
+                alt_models, similarity_scores, input_prices, output_prices = zip(*model_alts)
+                savings = (
+                    model_metrics['prompt_tokens'] * (current_pricing['input_price'] - np.array(input_prices, dtype=np.float64)) +
+                    model_metrics['completion_tokens'] * (current_pricing['output_price'] - np.array(output_prices, dtype=np.float64))
+                ) / 1000
                 
-                for alt in model_alts:
-                    alt_model = alt['alternative_model']
-                    if alt_model in price_lookup:
-                        # Calculate savings using pricing lookup
-                        current_pricing = price_lookup[model]
-                        alt_pricing = price_lookup[alt_model]
-                        
-                        current_input_cost = model_metrics['prompt_tokens'] * current_pricing['input_price'] / 1000
-                        current_output_cost = model_metrics['completion_tokens'] * current_pricing['output_price'] / 1000
-                        
-                        alt_input_cost = model_metrics['prompt_tokens'] * alt_pricing['input_price'] / 1000
-                        alt_output_cost = model_metrics['completion_tokens'] * alt_pricing['output_price'] / 1000
-                        
-                        potential_savings = (current_input_cost + current_output_cost) - (alt_input_cost + alt_output_cost)
-                        
-                        # Only recommend if savings are significant (>10%)
-                        if potential_savings > (model_metrics['total_spend'] * 0.1):
-                            recommendations.append({
-                                'current_model': model,
-                                'recommended_model': alt_model,
-                                'similarity_score': alt['similarity_score'],
-                                'potential_savings': potential_savings,
-                                'usage_count': model_metrics['total_requests'],
-                                'reason': f"Switch to save {potential_savings:.2f} based on your usage pattern"
-                            })
-                            
-                            # Force garbage collection after each significant operation
-                            if len(recommendations) % 10 == 0:
-                                gc.collect()
+                # Only recommend if savings are significant (>10%)
+                for i in np.flatnonzero(savings > model_metrics['total_spend'] * 0.1):
+                    potential_savings = float(savings[i])
+                    recommendations.append({
+                        'current_model': model,
+                        'recommended_model': alt_models[i],
+                        'similarity_score': similarity_scores[i],
+                        'potential_savings': potential_savings,
+                        'usage_count': model_metrics['total_requests'],
+                        'reason': f"Switch to save {potential_savings:.2f} based on your usage pattern"
+                    })
             
             # Sort recommendations by potential savings
             recommendations.sort(key=lambda x: x['potential_savings'], reverse=True)
             return recommendations  # Return all recommendations
             
-        except Exception as e:
-            print(f"Error in analyze_model_usage: {str(e)}")
-            return []
+        except Exception:
+            logger.exception("Error in analyze_model_usage")
+            raise
 
     @app.route('/api/recommendations')
     def get_recommendations():
         """Get recommendations with filters"""
         try:
-            # Parse filters
-            filters = parse_filters()
-            
             # Generate cache key from filters
-            cache_key = make_cache_key(
-                'recommendations',
-                filters.start_date.isoformat(),
-                filters.end_date.isoformat(),
-                *sorted(filters.models or []),
-                *sorted(filters.endpoints or []),
-                *sorted(filters.providers or [])
-            )
+            cache_key = request_cache_key('recommendations')
             
             # Get cached or fresh data
-            data = get_cached_recommendations(cache_key, get_ttl_hash())
+            data, etag = get_cached_recommendations(cache_key)
             
-            return jsonify(data)
+            return conditional_json(data, etag)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -1186,7 +1554,7 @@ def create_app():
             filters = parse_filters()
             
             # Get usage metrics for the period
-            metrics = get_model_usage_metrics(filters.start_date.isoformat(), filters.end_date.isoformat(), filters.models if filters.models else None)
+            metrics = get_model_usage_metrics(filters.start_iso, filters.end_iso, filters.models if filters.models else None)
             
             # Generate recommendations
             recommendations = analyze_model_usage(metrics)
@@ -1199,17 +1567,24 @@ def create_app():
                 'total_potential_savings': total_potential_savings,
                 'filters': {
                     'granularity': '30d',
-                    'start_date': filters.start_date.isoformat(),
-                    'end_date': filters.end_date.isoformat(),
+                    'start_date': filters.start_iso,
+                    'end_date': filters.end_iso,
                     'models': filters.models,
                     'endpoints': filters.endpoints
                 }
             }
-        except Exception as e:
-            print(f"Error in recommendations: {str(e)}")
-            print(f"Full error details: {repr(e)}")
+        except Exception:
+            logger.exception("Error in recommendations")
             raise
 
+    def stream_logs(rows, meta: Dict[str, Any]):
+        """Yield a logs response body row by row instead of serializing it in one go"""
+        yield b'{"logs":['
+        for i, row in enumerate(rows):
+            yield (b',' if i else b'') + orjson.dumps(row, default=str)
+        # Splice the remaining top-level keys in after the logs array
+        yield b'],' + orjson.dumps(meta, default=str)[1:]
+
     @app.route('/api/logs')
     def get_logs():
         """Get detailed token usage logs with alternative models"""
@@ -1225,9 +1600,8 @@ def create_app():
             sort_desc = request.args.get('sort_desc', 'true').lower() == 'true'
             
             # Validate sort_by field
-            valid_sort_fields = ['timestamp', 'total_cost', 'total_tokens', 'latency_ms']
-            if sort_by not in valid_sort_fields:
-                return jsonify({'error': f'Invalid sort field. Must be one of: {valid_sort_fields}'}), 400
+            if sort_by not in VALID_SORT_FIELDS:
+                return jsonify({'error': f'Invalid sort field. Must be one of: {sorted(VALID_SORT_FIELDS)}'}), 400
             
             # Get filters
             try:
@@ -1237,13 +1611,13 @@ def create_app():
             
             # Start query
             query = app.supabase.table('token_logs').select(
-                "*",
+                LOG_COLUMNS,
                 count="exact"
             )
             
             # Apply filters
-            query = query.gte('timestamp', filters.start_date.isoformat())
-            query = query.lt('timestamp', filters.end_date.isoformat())
+            query = query.gte('timestamp', filters.start_iso)
+            query = query.lt('timestamp', filters.end_iso)
             
             if filters.models:
                 query = query.in_('model', filters.models)
@@ -1257,28 +1631,30 @@ def create_app():
             # Apply sorting
             query = query.order(sort_by, desc=sort_desc)
             
-            # Get total count first
-            count_response = query.execute()
-            total_count = count_response.count or 0
+            def fetch_page(page_number: int):
+                offset = (page_number - 1) * per_page
+                return query.range(offset, offset + per_page - 1).execute()
+            
+            # Fetch the requested page and the exact total in one round trip
+            try:
+                response = fetch_page(page)
+                total_count = response.count or 0
+            except APIError:
+                # PostgREST answers 416 for pages past the end; look up the total and clamp below
+                response = None
+                total_count = query.range(0, 0).execute().count or 0
             
             # Calculate pagination
             total_pages = (total_count + per_page - 1) // per_page if total_count > 0 else 1
-            page = min(page, total_pages)  # Ensure page doesn't exceed total pages
-            
-            # Apply pagination
-            start = (page - 1) * per_page
-            end = start + per_page - 1
+            clamped_page = min(page, total_pages)  # Ensure page doesn't exceed total pages
             
-            # Only apply range if we have data
-            if total_count > 0:
-                query = query.range(start, end)
-            
-            # Execute query
-            response = query.execute()
+            # Only refetch when the requested page had to be clamped
+            if response is None or clamped_page != page:
+                page = clamped_page
+                response = fetch_page(page)
             logs = response.data or []
             
-            return jsonify({
-                'logs': logs,
+            return Response(stream_with_context(stream_logs(logs, {
                 'pagination': {
                     'page': page,
                     'per_page': per_page,
@@ -1287,34 +1663,53 @@ def create_app():
                 },
                 'filters': {
                     'granularity': filters.time_granularity.value,
-                    'start_date': filters.start_date.isoformat(),
-                    'end_date': filters.end_date.isoformat(),
+                    'start_date': filters.start_iso,
+                    'end_date': filters.end_iso,
                     'models': filters.models,
                     'endpoints': filters.endpoints,
                     'providers': filters.providers,
                     'sort_by': sort_by,
                     'sort_desc': sort_desc
                 }
-            })
+            })), mimetype='application/json')
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @cached(TTLCache(maxsize=2, ttl=1), lock=threading.Lock())
+    def process_stats(detail: bool) -> Dict[str, Any]:
+        """Sample process stats at most once per second; fd/socket enumeration only when detail is requested"""
+        proc = current_process()
+        with proc.oneshot():
+            memory_info = proc.memory_info()
+            stats = {
+                'rss': memory_info.rss / 1024 / 1024,  # RSS in MB
+                'vms': memory_info.vms / 1024 / 1024,  # VMS in MB
+                'percent': proc.memory_percent(),
+                'num_threads': proc.num_threads(),
+                'timestamp': datetime.now(tz.utc).isoformat()
+            }
+        if detail:
+            # Each of these walks /proc/<pid>/fd (and net/tcp*), so keep them off the scrape path
+            stats['connections'] = len(proc.connections())
+            stats['open_files'] = len(proc.open_files())
+        return stats
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        """Prometheus exposition of the cache, retry and fallback counters"""
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            # Under gunicorn (see gunicorn.conf.py) every worker writes its counters to that
+            # directory, so whichever worker serves the scrape reports the whole server
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+            return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+        return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
     # Add memory monitoring endpoint
     @app.route('/api/system/memory', methods=['GET'])
     def get_memory_stats():
-        """Get current memory usage statistics"""
-        process = psutil.Process(os.getpid())
-        memory_info = process.memory_info()
-        
-        return jsonify({
-            'rss': memory_info.rss / 1024 / 1024,  # RSS in MB
-            'vms': memory_info.vms / 1024 / 1024,  # VMS in MB
-            'percent': process.memory_percent(),
-            'num_threads': process.num_threads(),
-            'connections': len(process.connections()),
-            'open_files': len(process.open_files()),
-            'timestamp': datetime.now(tz.utc).isoformat()
-        })
+        """Get current memory usage statistics; pass ?detail=1 for connection and open file counts"""
+        return jsonify(process_stats(request.args.get('detail') == '1'))
 
     return app
 
@@ -1,5 +1,6 @@
 import multiprocessing
 import os
+import shutil
 
 # Python path configuration
 pythonpath = os.path.dirname(os.path.dirname(__file__))
@@ -25,6 +26,21 @@ preload_app = False  # Disable preloading to save memory
 
 # Memory optimization
 worker_tmp_dir = '/dev/shm'
+
+# Prometheus multiprocess mode: workers write their counters to files here and
+# /metrics sums them, so a scrape reaching any worker sees the whole server.
+# Set before the workers import the app (preload_app is off).
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/dev/shm/tokenoptimizer-metrics')
+
+def on_starting(server):
+    # Start from zero; files left by a previous run would be summed in
+    multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
 worker_max_requests = 1000
 worker_max_requests_jitter = 50
 
@@ -0,0 +1,77 @@
+-- Server-side spend aggregations for backend/models/queries.py.
+-- Each returns one row per model / endpoint / day since start_date in the
+-- shape the query helpers already return, instead of every token_logs row.
+-- Like the raw-row fallback there is no upper bound ('infinity'), so rows
+-- timestamped after now() are still counted; token_logs_hourly_range reads
+-- the hours the rollup may not have caught up with from token_logs.
+-- Requires token_logs_hourly_range (see metrics_breakdown_functions.sql); the
+-- edge rows it reads from token_logs are covered by token_logs_ts_model_ep_prov_idx.
+
+CREATE OR REPLACE FUNCTION spend_by_model(start_date timestamptz)
+RETURNS TABLE (
+    model text,
+    total_cost double precision
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT r.model, COALESCE(SUM(r.spend), 0)::float8
+    FROM token_logs_hourly_range(start_date, 'infinity') r
+    GROUP BY r.model;
+$$;
+
+CREATE OR REPLACE FUNCTION spend_by_endpoint(start_date timestamptz)
+RETURNS TABLE (
+    endpoint text,
+    total_cost double precision
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT r.endpoint_name, COALESCE(SUM(r.spend), 0)::float8
+    FROM token_logs_hourly_range(start_date, 'infinity') r
+    GROUP BY r.endpoint_name;
+$$;
+
+-- `date` is 'YYYY-MM-DD', the same day keys the Python aggregation used
+CREATE OR REPLACE FUNCTION spend_by_day(start_date timestamptz)
+RETURNS TABLE (
+    date text,
+    total_cost double precision
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT to_char(date_trunc('day', r.bucket), 'YYYY-MM-DD'), COALESCE(SUM(r.spend), 0)::float8
+    FROM token_logs_hourly_range(start_date, 'infinity') r
+    GROUP BY 1
+    ORDER BY 1;
+$$;
+
+-- All three dashboard aggregations from one pass over the range:
+-- {"by_model": [...], "by_endpoint": [...], "by_day": [...]} with the same
+-- row shapes as the functions above
+CREATE OR REPLACE FUNCTION dashboard_spend(start_date timestamptz)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+    WITH base AS MATERIALIZED (
+        SELECT r.model, r.endpoint_name, date_trunc('day', r.bucket) AS day, r.spend
+        FROM token_logs_hourly_range(start_date, 'infinity') r
+    )
+    SELECT jsonb_build_object(
+        'by_model', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('model', m.model, 'total_cost', m.total_cost)), '[]'::jsonb)
+            FROM (SELECT model, COALESCE(SUM(spend), 0)::float8 AS total_cost FROM base GROUP BY model) m
+        ),
+        'by_endpoint', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('endpoint', e.endpoint_name, 'total_cost', e.total_cost)), '[]'::jsonb)
+            FROM (SELECT endpoint_name, COALESCE(SUM(spend), 0)::float8 AS total_cost FROM base GROUP BY endpoint_name) e
+        ),
+        'by_day', (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object('date', to_char(d.day, 'YYYY-MM-DD'), 'total_cost', d.total_cost) ORDER BY d.day), '[]'::jsonb)
+            FROM (SELECT day, COALESCE(SUM(spend), 0)::float8 AS total_cost FROM base GROUP BY day) d
+        )
+    );
+$$;
@@ -0,0 +1,16 @@
+-- Distinct (model, endpoint_name, api_provider) combinations for /api/filters.
+-- The filter relationship maps are built from these few rows instead of a
+-- full token_logs download.
+
+CREATE OR REPLACE FUNCTION filter_triples()
+RETURNS TABLE (
+    model text,
+    endpoint_name text,
+    api_provider text
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT DISTINCT t.model, t.endpoint_name, t.api_provider
+    FROM token_logs t;
+$$;
@@ -0,0 +1,120 @@
+-- Server-side aggregations for /api/metrics/by-model, /api/metrics/by-endpoint
+-- and the monthly metrics query. Each returns one row per group in the shape
+-- the API already serves, so only O(groups) rows leave the database.
+-- Requires token_logs_hourly (see token_logs_hourly_rollup.sql).
+
+-- Hourly buckets covering [start_date, end_date] inclusive: whole hours come
+-- from the token_logs_hourly rollup, the partial hours at either edge from
+-- token_logs, so totals match a raw scan of the same range. The rollup is only
+-- trusted up to the hour that ended at least 10 minutes ago (two refresh
+-- intervals), so rows written since its last refresh are read from token_logs.
+CREATE OR REPLACE FUNCTION token_logs_hourly_range(start_date timestamptz, end_date timestamptz)
+RETURNS TABLE (
+    bucket timestamptz,
+    api_provider text,
+    model text,
+    endpoint_name text,
+    spend double precision,
+    requests bigint,
+    tokens bigint
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH bounds AS (
+        SELECT
+            CASE WHEN date_trunc('hour', start_date) = start_date
+                 THEN start_date
+                 ELSE date_trunc('hour', start_date) + interval '1 hour'
+            END AS full_start,
+            LEAST(
+                date_trunc('hour', end_date),
+                date_trunc('hour', now() - interval '10 minutes')
+            ) AS full_end
+    )
+    SELECT h.bucket, h.api_provider, h.model, h.endpoint_name, h.spend::float8, h.requests, h.tokens::bigint
+    FROM token_logs_hourly h, bounds b
+    WHERE h.bucket >= b.full_start
+      AND h.bucket < b.full_end
+    UNION ALL
+    SELECT date_trunc('hour', t.timestamp), t.api_provider, t.model, t.endpoint_name, t.total_cost::float8, 1, t.total_tokens::bigint
+    FROM token_logs t, bounds b
+    WHERE t.timestamp >= start_date
+      AND t.timestamp <= end_date
+      AND (t.timestamp < b.full_start OR t.timestamp >= b.full_end);
+$$;
+
+CREATE OR REPLACE FUNCTION metrics_by_model(start_date timestamptz, end_date timestamptz)
+RETURNS TABLE (
+    model text,
+    total_spend double precision,
+    total_requests bigint,
+    total_tokens bigint,
+    endpoints_used text[],
+    providers_used text[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        r.model,
+        COALESCE(SUM(r.spend), 0)::float8,
+        COALESCE(SUM(r.requests), 0)::bigint,
+        COALESCE(SUM(r.tokens), 0)::bigint,
+        array_agg(DISTINCT r.endpoint_name ORDER BY r.endpoint_name),
+        array_agg(DISTINCT r.api_provider ORDER BY r.api_provider)
+    FROM token_logs_hourly_range(start_date, end_date) r
+    GROUP BY r.model
+    ORDER BY 2 DESC;
+$$;
+
+CREATE OR REPLACE FUNCTION metrics_by_endpoint(start_date timestamptz, end_date timestamptz)
+RETURNS TABLE (
+    endpoint text,
+    total_spend double precision,
+    total_requests bigint,
+    total_tokens bigint,
+    models_used text[],
+    providers_used text[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        r.endpoint_name,
+        COALESCE(SUM(r.spend), 0)::float8,
+        COALESCE(SUM(r.requests), 0)::bigint,
+        COALESCE(SUM(r.tokens), 0)::bigint,
+        array_agg(DISTINCT r.model ORDER BY r.model),
+        array_agg(DISTINCT r.api_provider ORDER BY r.api_provider)
+    FROM token_logs_hourly_range(start_date, end_date) r
+    GROUP BY r.endpoint_name
+    ORDER BY 2 DESC;
+$$;
+
+-- `period` is 'YYYY-MM' to match the month keys built by the API
+CREATE OR REPLACE FUNCTION metrics_by_month(start_date timestamptz, end_date timestamptz)
+RETURNS TABLE (
+    period text,
+    total_spend double precision,
+    total_requests bigint,
+    total_tokens bigint,
+    models_used text[],
+    endpoints_used text[],
+    providers_used text[]
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        to_char(date_trunc('month', r.bucket), 'YYYY-MM'),
+        COALESCE(SUM(r.spend), 0)::float8,
+        COALESCE(SUM(r.requests), 0)::bigint,
+        COALESCE(SUM(r.tokens), 0)::bigint,
+        array_agg(DISTINCT r.model ORDER BY r.model),
+        array_agg(DISTINCT r.endpoint_name ORDER BY r.endpoint_name),
+        array_agg(DISTINCT r.api_provider ORDER BY r.api_provider)
+    FROM token_logs_hourly_range(start_date, end_date) r
+    GROUP BY 1
+    ORDER BY 1;
+$$;
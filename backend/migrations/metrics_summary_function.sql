@@ -0,0 +1,62 @@
+-- Server-side aggregation for /api/metrics/summary. Returns one row per
+-- provider, model and endpoint (tagged by `dimension`) from a single scan, so
+-- the API never pages raw token_logs rows. Whole hours are read from the
+-- token_logs_hourly rollup (see token_logs_hourly_rollup.sql); only the
+-- partial hours at either edge of the range touch the raw table.
+
+CREATE OR REPLACE FUNCTION metrics_summary(
+    start_date timestamptz,
+    end_date timestamptz,
+    models text[] DEFAULT NULL,
+    endpoints text[] DEFAULT NULL,
+    providers text[] DEFAULT NULL
+)
+RETURNS TABLE (
+    dimension text,
+    name text,
+    total_spend double precision,
+    total_requests bigint,
+    total_tokens bigint
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH bounds AS (
+        SELECT
+            CASE WHEN date_trunc('hour', start_date) = start_date
+                 THEN start_date
+                 ELSE date_trunc('hour', start_date) + interval '1 hour'
+            END AS full_start,
+            date_trunc('hour', end_date) AS full_end
+    ),
+    buckets AS (
+        SELECT h.api_provider, h.model, h.endpoint_name, h.spend AS cost, h.requests, h.tokens
+        FROM token_logs_hourly h, bounds b
+        WHERE h.bucket >= b.full_start
+          AND h.bucket < b.full_end
+          AND (models IS NULL OR h.model = ANY(models))
+          AND (endpoints IS NULL OR h.endpoint_name = ANY(endpoints))
+          AND (providers IS NULL OR h.api_provider = ANY(providers))
+        UNION ALL
+        SELECT t.api_provider, t.model, t.endpoint_name, t.total_cost, 1, t.total_tokens
+        FROM token_logs t, bounds b
+        WHERE t.timestamp >= start_date
+          AND t.timestamp < end_date
+          AND (t.timestamp < b.full_start OR t.timestamp >= b.full_end)
+          AND (models IS NULL OR t.model = ANY(models))
+          AND (endpoints IS NULL OR t.endpoint_name = ANY(endpoints))
+          AND (providers IS NULL OR t.api_provider = ANY(providers))
+    )
+    SELECT
+        CASE
+            WHEN GROUPING(api_provider) = 0 THEN 'provider'
+            WHEN GROUPING(model) = 0 THEN 'model'
+            ELSE 'endpoint'
+        END AS dimension,
+        COALESCE(api_provider, model, endpoint_name) AS name,
+        COALESCE(SUM(cost), 0)::float8 AS total_spend,
+        SUM(requests)::bigint AS total_requests,
+        COALESCE(SUM(tokens), 0)::bigint AS total_tokens
+    FROM buckets
+    GROUP BY GROUPING SETS ((api_provider), (model), (endpoint_name));
+$$;
@@ -0,0 +1,39 @@
+-- Server-side per-model usage totals for /api/recommendations. Replaces the
+-- Python loop over every token_logs row in the period, including the running
+-- latency average, with one grouped query.
+
+CREATE OR REPLACE FUNCTION model_usage_metrics(
+    start_date timestamptz,
+    end_date timestamptz,
+    models text[] DEFAULT NULL
+)
+RETURNS TABLE (
+    model text,
+    total_spend double precision,
+    total_requests bigint,
+    total_tokens bigint,
+    prompt_tokens bigint,
+    completion_tokens bigint,
+    input_cost double precision,
+    output_cost double precision,
+    avg_latency double precision
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        t.model,
+        COALESCE(SUM(t.total_cost), 0)::float8,
+        COUNT(*),
+        COALESCE(SUM(t.total_tokens), 0)::bigint,
+        COALESCE(SUM(t.prompt_tokens), 0)::bigint,
+        COALESCE(SUM(t.completion_tokens), 0)::bigint,
+        COALESCE(SUM(t.input_cost), 0)::float8,
+        COALESCE(SUM(t.output_cost), 0)::float8,
+        COALESCE(AVG(t.latency_ms) FILTER (WHERE t.latency_ms IS NOT NULL), 0)::float8
+    FROM token_logs t
+    WHERE t.timestamp >= start_date
+      AND t.timestamp < end_date
+      AND (models IS NULL OR t.model = ANY(models))
+    GROUP BY t.model;
+$$;
@@ -0,0 +1,17 @@
+-- Partial indexes for the recommendation reference lookups.
+-- The API only ever reads active model_pricing rows and recommended
+-- model_alternatives rows, so index just those and carry the selected
+-- columns for index-only scans.
+-- CONCURRENTLY cannot run inside a transaction block: run each statement on its own.
+
+-- One active price per model; the API's pricing lookup is keyed on model
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS model_pricing_active_model_idx
+    ON model_pricing (model)
+    INCLUDE (input_price, output_price)
+    WHERE is_active;
+
+-- Recommended alternatives grouped by the model they replace
+CREATE INDEX CONCURRENTLY IF NOT EXISTS model_alternatives_recommended_idx
+    ON model_alternatives (source_model)
+    INCLUDE (alternative_model, similarity_score)
+    WHERE is_recommended;
@@ -0,0 +1,15 @@
+-- Oldest and newest token_logs timestamps in one round-trip, used by
+-- parse_filters when the request doesn't pin a date range. Both aggregates
+-- are answered from the timestamp index.
+
+CREATE OR REPLACE FUNCTION date_range()
+RETURNS TABLE (
+    min_timestamp timestamptz,
+    max_timestamp timestamptz
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT MIN(t.timestamp), MAX(t.timestamp)
+    FROM token_logs t;
+$$;
@@ -0,0 +1,84 @@
+-- Hourly rollup of token_logs used by /api/metrics/trend.
+-- Every supported granularity (hour, day, week, month, year) is a rollup of
+-- hourly buckets, so the trend query aggregates this view instead of
+-- re-bucketing the raw table on every request.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS token_logs_hourly AS
+SELECT
+    date_trunc('hour', timestamp) AS bucket,
+    api_provider,
+    model,
+    endpoint_name,
+    SUM(total_cost) AS spend,
+    COUNT(*) AS requests,
+    SUM(total_tokens) AS tokens
+FROM token_logs
+GROUP BY 1, 2, 3, 4;
+
+-- Required for REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS token_logs_hourly_key_idx
+    ON token_logs_hourly (bucket, api_provider, model, endpoint_name);
+
+-- Refresh every 5 minutes without blocking readers (requires pg_cron)
+SELECT cron.schedule(
+    'refresh-token-logs-hourly',
+    '*/5 * * * *',
+    $$REFRESH MATERIALIZED VIEW CONCURRENTLY token_logs_hourly$$
+);
+
+-- Trend buckets for a date range and optional filters.
+-- Whole hours are read from the rollup; the partial hours at either edge of
+-- the range are read from token_logs so the totals match the raw filter.
+-- `period` uses the same 'YYYY-MM-DD HH24:00:00' keys as the API buckets.
+CREATE OR REPLACE FUNCTION metrics_trend(
+    start_date timestamptz,
+    end_date timestamptz,
+    granularity text,
+    models text[] DEFAULT NULL,
+    endpoints text[] DEFAULT NULL,
+    providers text[] DEFAULT NULL
+)
+RETURNS TABLE (
+    period text,
+    total_spend double precision,
+    total_requests bigint,
+    total_tokens bigint
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH bounds AS (
+        SELECT
+            CASE WHEN date_trunc('hour', start_date) = start_date
+                 THEN start_date
+                 ELSE date_trunc('hour', start_date) + interval '1 hour'
+            END AS full_start,
+            date_trunc('hour', end_date) AS full_end
+    ),
+    buckets AS (
+        SELECT h.bucket AS ts, h.spend AS cost, h.requests, h.tokens
+        FROM token_logs_hourly h, bounds b
+        WHERE h.bucket >= b.full_start
+          AND h.bucket < b.full_end
+          AND (models IS NULL OR h.model = ANY(models))
+          AND (endpoints IS NULL OR h.endpoint_name = ANY(endpoints))
+          AND (providers IS NULL OR h.api_provider = ANY(providers))
+        UNION ALL
+        SELECT t.timestamp, t.total_cost, 1, t.total_tokens
+        FROM token_logs t, bounds b
+        WHERE t.timestamp >= start_date
+          AND t.timestamp < end_date
+          AND (t.timestamp < b.full_start OR t.timestamp >= b.full_end)
+          AND (models IS NULL OR t.model = ANY(models))
+          AND (endpoints IS NULL OR t.endpoint_name = ANY(endpoints))
+          AND (providers IS NULL OR t.api_provider = ANY(providers))
+    )
+    SELECT
+        to_char(date_trunc(granularity, ts), 'YYYY-MM-DD HH24:00:00') AS period,
+        COALESCE(SUM(cost), 0)::float8 AS total_spend,
+        SUM(requests)::bigint AS total_requests,
+        COALESCE(SUM(tokens), 0)::bigint AS total_tokens
+    FROM buckets
+    GROUP BY 1
+    ORDER BY 1;
+$$;
@@ -0,0 +1,14 @@
+-- Covering indexes for the dashboard filter scans on token_logs.
+-- Every metrics and logs query filters on a timestamp range plus an optional
+-- subset of model / endpoint_name / api_provider, so these let the summary
+-- aggregations run as index-only scans instead of sequential scans.
+-- CONCURRENTLY cannot run inside a transaction block: run each statement on its own.
+
+-- Time range scans; INCLUDE carries the filter and aggregate columns
+CREATE INDEX CONCURRENTLY IF NOT EXISTS token_logs_ts_model_ep_prov_idx
+    ON token_logs (timestamp DESC)
+    INCLUDE (api_provider, model, endpoint_name, total_cost, total_tokens, latency_ms);
+
+-- Filter-by-provider/model scans within a time range
+CREATE INDEX CONCURRENTLY IF NOT EXISTS token_logs_prov_model_ts_idx
+    ON token_logs (api_provider, model, timestamp DESC);
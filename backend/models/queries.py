@@ -3,57 +3,124 @@ Database queries for the TokenOptimizer dashboard.
 Follows the requirements for data retrieval and aggregation.
 """
 
-from typing import Dict, List, Any
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterator, List, Any, Optional
 from datetime import datetime, timedelta
 
+from postgrest.exceptions import APIError
+
+logger = logging.getLogger(__name__)
+
+# Rows per page for raw-row fallbacks; keep in step with PostgREST's max-rows
+PAGE_SIZE = int(os.getenv('SUPABASE_MAX_ROWS', '1000'))
+
+# PostgREST's "function not found in the schema cache" error code
+FUNCTION_NOT_FOUND_CODE = 'PGRST202'
+
+def _call_rpc(supabase, function_name: str, start_date: str) -> Optional[Any]:
+    """Run a spend aggregation in Postgres, or None if the function isn't deployed."""
+    try:
+        return supabase.rpc(function_name, {'start_date': start_date}).execute().data
+    except APIError as e:
+        if e.code != FUNCTION_NOT_FOUND_CODE:
+            raise
+        logger.warning("RPC %s not deployed, using fallback: %s", function_name, e)
+        return None
+
+def iter_rows(query, page: int = PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yield every row of a built select one page at a time, without mutating the builder.
+
+    Rows are ordered by id unless the select is already ordered, and paging stops at the
+    first empty page, so a max-rows cap below page shortens pages instead of truncating.
+    """
+    params = query.params if 'order' in query.params else query.params.add('order', 'id')
+    offset = 0
+    while True:
+        headers = query.headers.copy()
+        headers['Range-Unit'] = 'items'
+        headers['Range'] = f'{offset}-{offset + page - 1}'
+        response = query.session.request(query.http_method, query.path, params=params, headers=headers)
+        if response.status_code == 416:  # Offset past the last row
+            return
+        response.raise_for_status()
+        rows = response.json()
+        if not rows:
+            return
+        yield from rows
+        offset += len(rows)
+
 def get_spend_by_model(supabase, start_date: str) -> List[Dict[str, Any]]:
     """Get total spend grouped by model."""
-    response = supabase.table('token_logs').select(
+    rows = _call_rpc(supabase, 'spend_by_model', start_date)
+    if rows is not None:
+        return rows
+
+    # Fall back to summing the raw rows
+    rows = iter_rows(supabase.table('token_logs').select(
         "model, total_cost"
-    ).gte('timestamp', start_date).execute()
+    ).gte('timestamp', start_date))
     
     # Aggregate by model
-    model_spend = {}
-    for row in response.data:
-        model = row['model']
-        cost = row['total_cost']
-        model_spend[model] = model_spend.get(model, 0) + cost
+    model_spend = defaultdict(float)
+    for row in rows:
+        model_spend[row['model']] += row['total_cost'] or 0
     
     # Convert to list of dictionaries
     return [{'model': k, 'total_cost': v} for k, v in model_spend.items()]
 
 def get_spend_by_endpoint(supabase, start_date: str) -> List[Dict[str, Any]]:
     """Get total spend grouped by endpoint."""
-    response = supabase.table('token_logs').select(
+    rows = _call_rpc(supabase, 'spend_by_endpoint', start_date)
+    if rows is not None:
+        return rows
+
+    # Fall back to summing the raw rows
+    rows = iter_rows(supabase.table('token_logs').select(
         "endpoint_name, total_cost"
-    ).gte('timestamp', start_date).execute()
+    ).gte('timestamp', start_date))
     
     # Aggregate by endpoint
-    endpoint_spend = {}
-    for row in response.data:
-        endpoint = row['endpoint_name']
-        cost = row['total_cost']
-        endpoint_spend[endpoint] = endpoint_spend.get(endpoint, 0) + cost
+    endpoint_spend = defaultdict(float)
+    for row in rows:
+        endpoint_spend[row['endpoint_name']] += row['total_cost'] or 0
     
     # Convert to list of dictionaries
     return [{'endpoint': k, 'total_cost': v} for k, v in endpoint_spend.items()]
 
 def get_spend_trend(supabase, start_date: str) -> List[Dict[str, Any]]:
     """Get daily spend trend."""
-    response = supabase.table('token_logs').select(
+    rows = _call_rpc(supabase, 'spend_by_day', start_date)
+    if rows is not None:
+        return rows
+
+    # Fall back to summing the raw rows
+    rows = iter_rows(supabase.table('token_logs').select(
         "timestamp, total_cost"
-    ).gte('timestamp', start_date).execute()
+    ).gte('timestamp', start_date))
     
     # Aggregate by day
-    daily_spend = {}
-    for row in response.data:
-        date = row['timestamp'][:10]  # Get just the date part
-        cost = row['total_cost']
-        daily_spend[date] = daily_spend.get(date, 0) + cost
+    daily_spend = defaultdict(float)
+    for row in rows:
+        daily_spend[row['timestamp'][:10]] += row['total_cost'] or 0  # Key on just the date part
     
     # Convert to list of dictionaries
     return [{'date': k, 'total_cost': v} for k, v in sorted(daily_spend.items())]
 
+def get_dashboard_spend(supabase, start_date: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Get spend by model, by endpoint and by day in a single round-trip."""
+    data = _call_rpc(supabase, 'dashboard_spend', start_date)
+    if data is not None:
+        return data
+
+    # Fall back to the individual aggregations
+    return {
+        'by_model': get_spend_by_model(supabase, start_date),
+        'by_endpoint': get_spend_by_endpoint(supabase, start_date),
+        'by_day': get_spend_trend(supabase, start_date)
+    }
+
 def get_model_alternatives(supabase) -> List[Dict[str, Any]]:
     """Get recommended model alternatives."""
     response = supabase.table('model_alternatives').select(
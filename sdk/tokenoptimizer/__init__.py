@@ -5,7 +5,7 @@ This SDK provides a simple way to track token usage, latency, and costs
 for LLM API calls to OpenAI, Anthropic, and other providers.
 """
 
-from .core import tracked_completion, track_usage
+from .core import tracked_completion, track_usage, track_usage_async
 
-__all__ = ['tracked_completion', 'track_usage']
+__all__ = ['tracked_completion', 'track_usage', 'track_usage_async']
 __version__ = '0.1.0' 
\ No newline at end of file
@@ -6,9 +6,15 @@ This module provides the main tracking functions for LLM API calls.
 
 import time
 import json
+import asyncio
+import functools
 import logging
 import datetime
+import os
+import atexit
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Any, Optional, Union, Callable
 
 from .utils.validation import validate_input, validate_messages
@@ -17,6 +23,39 @@ from .utils.config import get_config
 # Set up logging
 logger = logging.getLogger("tokenoptimizer")
 
+# Shared HTTP session for sending usage logs, created on first use
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+# Keep-alive connections held per host, sized for apps logging from many threads
+_POOL_MAXSIZE = 20
+
+def _get_session() -> requests.Session:
+    """
+    Get the shared HTTP session used to send usage logs.
+    
+    Uses double-checked locking so that concurrent first calls from several
+    threads create exactly one session; later calls skip the lock entirely.
+    A forked child gets its own session rather than sharing the parent's
+    pooled sockets.
+    
+    Returns:
+        The shared requests.Session
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                atexit.register(session.close)
+                _session = session
+                _session_pid = os.getpid()
+    return _session
+
 def track_usage(
     model: str,
     prompt_tokens: int,
@@ -80,7 +119,7 @@ def track_usage(
     
     # Send data to TokenOptimizer API
     try:
-        response = requests.post(url=api_url, json=payload, timeout=3)
+        response = _get_session().post(url=api_url, json=payload, timeout=config.get("timeout", 3))
         if response.status_code == 201:
             logger.debug(f"TokenOptimizer: Successfully logged usage for {model}")
             return {"success": True, "log": response.json()["log"]}
@@ -90,6 +129,19 @@ def track_usage(
     except Exception as e:
         logger.warning(f"TokenOptimizer: Error logging usage: {str(e)}")
         return {"success": False, "error": str(e)}
+
+async def track_usage_async(*args, **kwargs) -> Dict[str, Any]:
+    """
+    Track token usage from asyncio code without blocking the event loop.
+    
+    Takes the same arguments as track_usage and runs it on the loop's default
+    executor, so other coroutines keep running while the log is sent.
+    
+    Returns:
+        Dict containing the logged information and status
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(track_usage, *args, **kwargs))
         
 def tracked_completion(
     model: str,